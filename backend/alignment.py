@@ -0,0 +1,109 @@
+import numpy as np
+
+#CTC forced alignment (Viterbi) of a known phoneme sequence against the phoneme model's own
+#per-frame log probabilities. Gives per-phoneme and per-word frame spans without a second model.
+
+#splits the raw phoneme list into words using the per-word phoneme strings of the assessment
+#(phoneme_content keeps the length marks, raw_phoneme_content does not)
+def split_words(raw_phonemes, word_phonemes):
+  words = []
+  index = 0
+  for word in word_phonemes:
+    target = len(word.replace("ː", ""))
+    start = index
+    consumed = 0
+    while index < len(raw_phonemes) and consumed < target:
+      consumed += len(raw_phonemes[index])
+      index += 1
+    words.append((word, start, index))
+  #anything left over belongs to the last word
+  if words and index < len(raw_phonemes):
+    word, start, _ = words[-1]
+    words[-1] = (word, start, len(raw_phonemes))
+  return words
+
+#maps each reference phoneme to the vocab ids it may be emitted as
+#(with or without the length mark, or char by char when the model has no single token for it)
+def phoneme_token_ids(raw_phonemes, vocab):
+  tokens = []
+  owners = []
+  for i, phoneme in enumerate(raw_phonemes):
+    if phoneme in vocab or phoneme + "ː" in vocab:
+      alternatives = [[vocab[p] for p in (phoneme, phoneme + "ː") if p in vocab]]
+    else:
+      alternatives = [[vocab[c]] for c in phoneme if c in vocab]
+    for ids in alternatives:
+      tokens.append(tuple(ids))
+      owners.append(i)
+  return tokens, owners
+
+#returns (start_frame, end_frame) for each token, or None when the clip is too short for the reference
+def viterbi(log_probs, tokens, blank_id):
+  T = log_probs.shape[0]
+  L = len(tokens)
+  repeats = sum(1 for a, b in zip(tokens, tokens[1:]) if a == b)
+  if L == 0 or T < L + repeats:
+    return None
+  S = 2 * L + 1
+  emissions = np.empty((T, S), dtype=np.float32)
+  emissions[:, 0::2] = log_probs[:, blank_id][:, None]
+  for k, ids in enumerate(tokens):
+    emissions[:, 2 * k + 1] = log_probs[:, list(ids)].max(axis=1)
+  #skipping the blank between two tokens is only allowed when they differ
+  can_skip = np.zeros(S, dtype=bool)
+  for k in range(1, L):
+    can_skip[2 * k + 1] = tokens[k] != tokens[k - 1]
+
+  neg_inf = np.float32(-np.inf)
+  alpha = np.full(S, neg_inf, dtype=np.float32)
+  alpha[0] = emissions[0, 0]
+  alpha[1] = emissions[0, 1]
+  back = np.zeros((T, S), dtype=np.int8)
+  stay = np.empty(S, dtype=np.float32)
+  step = np.empty(S, dtype=np.float32)
+  skip = np.empty(S, dtype=np.float32)
+  for t in range(1, T):
+    stay[:] = alpha
+    step[0] = neg_inf
+    step[1:] = alpha[:-1]
+    skip[:2] = neg_inf
+    skip[2:] = alpha[:-2]
+    skip[~can_skip] = neg_inf
+    candidates = np.stack((stay, step, skip))
+    choice = candidates.argmax(axis=0)
+    back[t] = choice
+    alpha = candidates[choice, np.arange(S)] + emissions[t]
+
+  state = S - 1 if alpha[S - 1] >= alpha[S - 2] else S - 2
+  path = np.empty(T, dtype=np.int64)
+  for t in range(T - 1, -1, -1):
+    path[t] = state
+    state -= back[t, state]
+
+  spans = []
+  for k in range(L):
+    frames = np.flatnonzero(path == 2 * k + 1)
+    spans.append((int(frames[0]), int(frames[-1]) + 1))
+  return spans
+
+#word offsets in the same format as processor2.batch_decode(..., output_word_offsets=True)
+def align_word_offsets(log_probs, raw_phonemes, word_phonemes, vocab, blank_id):
+  words = split_words(raw_phonemes, word_phonemes)
+  tokens, owners = phoneme_token_ids(raw_phonemes, vocab)
+  spans = viterbi(log_probs, tokens, blank_id)
+  T = log_probs.shape[0]
+  if spans is None:
+    #clip is shorter than the reference allows, spread the words by phoneme count instead
+    total = max(len(raw_phonemes), 1)
+    return [{"word": word, "start_offset": T * start // total, "end_offset": T * end // total}
+            for word, start, end in words if end > start]
+  phoneme_spans = {}
+  for owner, (start, end) in zip(owners, spans):
+    first, last = phoneme_spans.get(owner, (start, end))
+    phoneme_spans[owner] = (min(first, start), max(last, end))
+  word_offsets = []
+  for word, start, end in words:
+    aligned = [phoneme_spans[i] for i in range(start, end) if i in phoneme_spans]
+    if aligned:
+      word_offsets.append({"word": word, "start_offset": aligned[0][0], "end_offset": aligned[-1][1]})
+  return word_offsets
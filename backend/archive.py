@@ -0,0 +1,71 @@
+import io
+import logging
+import numpy as np
+import soundfile
+from ingest import decode
+from storage import get_storage
+
+#Archive tier for the recordings of saved submissions ("python cli.py archive-audio"). A recording is
+#downloaded, decoded to 16 kHz mono (the rate it is scored at) and stored again as low bitrate Opus in
+#an Ogg file, the history row then points at the Opus file and keeps the sizes before and after in
+#archive_original_bytes and archive_bytes. The functions here run in the worker processes of the CLI.
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_RATE = 16000
+
+#libsndfile has no bitrate setting for Opus, its compression level goes linearly from 256 kbps (0.0)
+#down to 6 kbps (1.0) per channel
+def opus_level(kbps):
+  return min(max((256 - kbps) / 250, 0.0), 1.0)
+
+def transcode_opus(data, kbps):
+  y, _ = decode(data, ARCHIVE_RATE)
+  encoded = io.BytesIO()
+  soundfile.write(encoded, np.clip(y, -1, 1), ARCHIVE_RATE, format="OGG", subtype="OPUS", compression_level=opus_level(kbps))
+  return encoded.getvalue()
+
+#the cloudinary credentials set in the CLI process, for pools that do not fork it
+def cloudinary_settings():
+  import cloudinary
+  config = cloudinary.config()
+  return {key: getattr(config, key, None) for key in ("cloud_name", "api_key", "api_secret", "secure")}
+
+def configure_worker(settings):
+  if settings:
+    import cloudinary
+    cloudinary.config(**settings)
+
+#returns the row's new url and public id with both sizes. A recording that is not smaller as Opus
+#is left where it is (no url in the result), it still gets its sizes so it is not tried again.
+def archive_recording(kind, history_id, audio_url, kbps):
+  storage = get_storage()
+  data = storage.download(audio_url)
+  encoded = transcode_opus(data, kbps)
+  result = {"kind": kind, "history_id": history_id, "original_bytes": len(data), "archive_bytes": len(data), "audio_url": None}
+  if len(encoded) < len(data):
+    upload = storage.upload(io.BytesIO(encoded))
+    result.update(archive_bytes=len(encoded), audio_url=upload["secure_url"], audio_public_id=upload["public_id"])
+  return result
+
+#points the history row at the Opus file and deletes the original, in the CLI process. Returns "archived",
+#"kept" (Opus was not smaller), "changed" (the row got another recording meanwhile, the Opus file is
+#deleted) or "failed" (the row is archived but the original could not be deleted)
+def save_archived(db, model, result, audio_url, public_id):
+  storage = get_storage()
+  fields = {"archive_original_bytes": result["original_bytes"], "archive_bytes": result["archive_bytes"]}
+  if result["audio_url"]:
+    fields.update(audio_url=result["audio_url"], audio_public_id=result["audio_public_id"])
+  #the url is checked again so a row changed since it was read keeps its recording
+  updated = db.query(model).filter(model.history_id == result["history_id"], model.audio_url == audio_url).update(fields)
+  db.commit()
+  if not result["audio_url"]:
+    return "kept" if updated else "changed"
+  stale = public_id if updated else result["audio_public_id"]
+  if stale:
+    try:
+      storage.delete(stale)
+    except Exception:
+      logger.warning("could not delete recording %s", stale, exc_info=True)
+      return "failed" if updated else "changed"
+  return "archived" if updated else "changed"
@@ -0,0 +1,195 @@
+import itertools
+import json
+import os
+import struct
+import numpy as np
+from config import MODEL_CACHE_DIR, ORT_INTRA_OP_THREADS, MODEL_DIR, MMAP_WEIGHTS
+
+#Inference backends for the CTC models. Every backend takes padded float32 input_values and an
+#int64 attention_mask as NumPy arrays and returns NumPy logits, so callers never touch torch.
+
+#number of logit frames the conv feature encoder produces for a clip of the given sample length
+def output_lengths(config, lengths):
+  lengths = np.asarray(lengths, dtype=np.int64)
+  for kernel, stride in zip(config.conv_kernel, config.conv_stride):
+    lengths = (lengths - kernel) // stride + 1
+  return lengths.tolist()
+
+def cache_path(checkpoint, suffix):
+  return os.path.join(MODEL_CACHE_DIR, checkpoint.replace("/", "--") + suffix)
+
+#checkpoints saved by "python cli.py fetch-models" live in MODEL_DIR, when one is there it is loaded
+#from disk and the Hugging Face Hub is never contacted
+def local_model_dir(checkpoint):
+  return os.path.join(MODEL_DIR, checkpoint.replace("/", "--"))
+
+def model_source(checkpoint):
+  path = local_model_dir(checkpoint)
+  return path if os.path.isdir(path) else checkpoint
+
+SAFETENSORS_DTYPES = {
+  "F64": np.float64, "F32": np.float32, "F16": np.float16,
+  "I64": np.int64, "I32": np.int32, "I16": np.int16, "I8": np.int8, "U8": np.uint8, "BOOL": np.bool_,
+}
+
+#maps every tensor of a safetensors file as a copy-on-write view of the file, nothing is read until used
+def mmap_safetensors(path):
+  with open(path, "rb") as f:
+    header_size = struct.unpack("<Q", f.read(8))[0]
+    header = json.loads(f.read(header_size))
+  data = np.memmap(path, dtype=np.uint8, mode="c", offset=8 + header_size)
+  arrays = {}
+  for name, info in header.items():
+    if name == "__metadata__" or info["dtype"] not in SAFETENSORS_DTYPES:
+      continue
+    begin, end = info["data_offsets"]
+    arrays[name] = data[begin:end].view(SAFETENSORS_DTYPES[info["dtype"]]).reshape(info["shape"])
+  return arrays
+
+#points the model's parameters at the mapped file instead of private memory. Every process that maps
+#the same file (forked from a preloading master or not) then shares the page cache pages, and since
+#inference never writes to the weights they are never copied. Returns how many tensors were swapped,
+#anything whose name, shape or dtype does not match the file keeps its own copy.
+def share_weights(ctcModel, path):
+  import torch
+  arrays = mmap_safetensors(path)
+  shared = 0
+  with torch.no_grad():
+    for name, tensor in itertools.chain(ctcModel.named_parameters(), ctcModel.named_buffers()):
+      array = arrays.get(name)
+      if array is None or tuple(array.shape) != tuple(tensor.shape):
+        continue
+      mapped = torch.from_numpy(array)
+      if mapped.dtype == tensor.dtype:
+        tensor.data = mapped
+        shared += 1
+  return shared
+
+class TorchBackend:
+  name = "torch"
+
+  def __init__(self, checkpoint, model_class):
+    self.checkpoint = checkpoint
+    self.model = self.load(checkpoint, model_class)
+    self.model.eval()
+    self.config = self.model.config
+    self.version = f"{checkpoint}:{self.name}"
+
+  def load(self, checkpoint, model_class):
+    source = model_source(checkpoint)
+    ctcModel = model_class.from_pretrained(source, low_cpu_mem_usage=True)
+    weights = os.path.join(source, "model.safetensors")
+    if MMAP_WEIGHTS and os.path.exists(weights):
+      share_weights(ctcModel, weights)
+    return ctcModel
+
+  def forward(self, input_values, attention_mask):
+    import torch
+    with torch.no_grad():
+      #models using group norm were trained without attention masks and expect plain zero padding
+      if self.config.feat_extract_norm == "layer":
+        logits = self.model(torch.from_numpy(input_values), attention_mask=torch.from_numpy(attention_mask)).logits
+      else:
+        logits = self.model(torch.from_numpy(input_values)).logits
+    return logits.numpy()
+
+  def output_lengths(self, lengths):
+    return output_lengths(self.config, lengths)
+
+#dynamic int8 quantization of every Linear layer (the transformer blocks and the CTC head),
+#the conv feature encoder stays fp32. The quantized weights are cached on disk after the first load.
+class Int8Backend(TorchBackend):
+  name = "int8"
+
+  def load(self, checkpoint, model_class):
+    import torch
+    from transformers import AutoConfig
+    path = cache_path(checkpoint, "-int8.pt")
+    if os.path.exists(path):
+      ctcModel = model_class(AutoConfig.from_pretrained(model_source(checkpoint)))
+      ctcModel = torch.quantization.quantize_dynamic(ctcModel, {torch.nn.Linear}, dtype=torch.qint8)
+      ctcModel.load_state_dict(torch.load(path))
+      return ctcModel
+    ctcModel = model_class.from_pretrained(model_source(checkpoint))
+    ctcModel.eval()
+    ctcModel = torch.quantization.quantize_dynamic(ctcModel, {torch.nn.Linear}, dtype=torch.qint8)
+    os.makedirs(MODEL_CACHE_DIR, exist_ok=True)
+    torch.save(ctcModel.state_dict(), path + ".tmp")
+    os.replace(path + ".tmp", path)
+    return ctcModel
+
+#runs a graph exported by export_onnx with ONNX Runtime, needs onnxruntime but not torch
+class OnnxBackend:
+  name = "onnx"
+
+  def __init__(self, checkpoint, model_class=None):
+    import onnxruntime as ort
+    from transformers import AutoConfig
+    path = cache_path(checkpoint, ".onnx")
+    if not os.path.exists(path):
+      raise FileNotFoundError(f"{path} does not exist, run 'python cli.py export-onnx' first")
+    options = ort.SessionOptions()
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+    options.intra_op_num_threads = ORT_INTRA_OP_THREADS
+    options.inter_op_num_threads = 1
+    self.session = ort.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+    self.input_names = {i.name for i in self.session.get_inputs()}
+    self.checkpoint = checkpoint
+    self.config = AutoConfig.from_pretrained(model_source(checkpoint))
+    self.version = f"{checkpoint}:{self.name}"
+
+  def forward(self, input_values, attention_mask):
+    feed = {"input_values": input_values}
+    if "attention_mask" in self.input_names:
+      feed["attention_mask"] = attention_mask
+    return self.session.run(["logits"], feed)[0]
+
+  def output_lengths(self, lengths):
+    return output_lengths(self.config, lengths)
+
+#exports a checkpoint to ONNX with dynamic batch and time axes, from the local Hugging Face cache only
+def export_onnx(checkpoint, model_class, opset=17):
+  import torch
+  ctcModel = model_class.from_pretrained(model_source(checkpoint), local_files_only=True)
+  ctcModel.eval()
+  use_mask = ctcModel.config.feat_extract_norm == "layer"
+  input_values = torch.zeros((1, 16000), dtype=torch.float32)
+  attention_mask = torch.ones((1, 16000), dtype=torch.int64)
+  dynamic_axes = {"input_values": {0: "batch", 1: "samples"}, "logits": {0: "batch", 1: "frames"}}
+  if use_mask:
+    dynamic_axes["attention_mask"] = {0: "batch", 1: "samples"}
+
+  class Logits(torch.nn.Module):
+    def __init__(self, inner):
+      super().__init__()
+      self.inner = inner
+
+    def forward(self, input_values, attention_mask=None):
+      return self.inner(input_values, attention_mask=attention_mask).logits
+
+  path = cache_path(checkpoint, ".onnx")
+  os.makedirs(MODEL_CACHE_DIR, exist_ok=True)
+  with torch.no_grad():
+    torch.onnx.export(
+      Logits(ctcModel),
+      (input_values, attention_mask) if use_mask else (input_values,),
+      path + ".tmp",
+      input_names=["input_values", "attention_mask"] if use_mask else ["input_values"],
+      output_names=["logits"],
+      dynamic_axes=dynamic_axes,
+      opset_version=opset,
+    )
+  os.replace(path + ".tmp", path)
+  return path
+
+BACKENDS = {
+  TorchBackend.name: TorchBackend,
+  Int8Backend.name: Int8Backend,
+  OnnxBackend.name: OnnxBackend,
+}
+
+def load_backend(name, checkpoint, model_class):
+  if name not in BACKENDS:
+    raise ValueError(f"Unknown inference backend '{name}', expected one of {', '.join(BACKENDS)}")
+  return BACKENDS[name](checkpoint, model_class)
@@ -0,0 +1,98 @@
+import collections
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+#Collects items submitted from any thread for up to max_wait_ms and hands them to
+#run_batch as one list. run_batch must return one result per item, in order.
+#Items submitted together with submit_many always land in the same batch, a group that would take the
+#batch past max_batch_size starts the next one instead (a group bigger than that runs on its own).
+class MicroBatcher:
+  def __init__(self, run_batch, max_batch_size=8, max_wait_ms=10, name="batcher"):
+    self.run_batch = run_batch
+    self.max_batch_size = max(1, max_batch_size)
+    self.max_wait = max_wait_ms / 1000
+    self.name = name
+    self._queue = queue.Queue()
+    self._thread = None
+    self._start_lock = threading.Lock()
+    self._stats_lock = threading.Lock()
+    self._batches = 0
+    self._items = 0
+    self._batch_sizes = collections.Counter()
+    self._waits = collections.deque(maxlen=1000)
+    self._wait_max = 0.0
+
+  def submit(self, item):
+    return self.submit_many([item])[0]
+
+  def submit_many(self, items):
+    self._ensure_started()
+    enqueued = time.perf_counter()
+    group = [(item, Future(), enqueued) for item in items]
+    self._queue.put(group)
+    return [future for _, future, _ in group]
+
+  def _ensure_started(self):
+    if self._thread is not None:
+      return
+    with self._start_lock:
+      if self._thread is None:
+        self._thread = threading.Thread(target=self._loop, name=self.name, daemon=True)
+        self._thread.start()
+
+  def _loop(self):
+    held = None
+    while True:
+      pending = list(held if held is not None else self._queue.get())
+      held = None
+      deadline = time.perf_counter() + self.max_wait
+      while len(pending) < self.max_batch_size:
+        timeout = deadline - time.perf_counter()
+        if timeout <= 0:
+          break
+        try:
+          group = self._queue.get(timeout=timeout)
+        except queue.Empty:
+          break
+        if len(pending) + len(group) > self.max_batch_size:
+          held = group
+          break
+        pending.extend(group)
+      self._dispatch(pending)
+
+  def _dispatch(self, pending):
+    started = time.perf_counter()
+    self._record(len(pending), [started - enqueued for _, _, enqueued in pending])
+    try:
+      results = self.run_batch([item for item, _, _ in pending])
+    except Exception as e:
+      for _, future, _ in pending:
+        future.set_exception(e)
+      return
+    for (_, future, _), result in zip(pending, results):
+      future.set_result(result)
+
+  def _record(self, size, waits):
+    with self._stats_lock:
+      self._batches += 1
+      self._items += size
+      self._batch_sizes[size] += 1
+      self._waits.extend(waits)
+      self._wait_max = max(self._wait_max, max(waits))
+
+  def stats(self):
+    with self._stats_lock:
+      waits = sorted(self._waits)
+      return {
+        "batches": self._batches,
+        "items": self._items,
+        "mean_batch_size": round(self._items / self._batches, 2) if self._batches else 0,
+        "batch_sizes": dict(sorted(self._batch_sizes.items())),
+        "queue_wait_ms_p50": round(waits[len(waits) // 2] * 1000, 2) if waits else 0,
+        "queue_wait_ms_p95": round(waits[int(len(waits) * 0.95)] * 1000, 2) if waits else 0,
+        "queue_wait_ms_max": round(self._wait_max * 1000, 2),
+        "max_batch_size": self.max_batch_size,
+        "max_wait_ms": self.max_wait * 1000,
+      }
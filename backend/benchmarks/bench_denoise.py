@@ -0,0 +1,65 @@
+#compares the old denoise code (2-D medfilt mask plus noisereduce's own STFT) against denoise.py
+#usage (from backend/): python benchmarks/bench_denoise.py [--repeat N]
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import librosa
+import numpy as np
+import noisereduce as nr
+from scipy.signal import medfilt
+from denoise import denoise, N_FFT, HOP_LENGTH
+
+sr = 16000
+
+def synthetic_clip(seconds):
+  #harmonic bursts (a quarter second every second) over background noise
+  rng = np.random.default_rng(0)
+  t = np.arange(int(seconds * sr)) / sr
+  envelope = ((t % 1.0) < 0.25).astype(np.float32)
+  voiced = np.sin(2 * np.pi * 220 * t) + 0.5 * np.sin(2 * np.pi * 660 * t) + 0.3 * np.sin(2 * np.pi * 1500 * t)
+  return (0.3 * envelope * voiced + 0.02 * rng.standard_normal(len(t))).astype(np.float32)
+
+def old_denoise(input_values):
+  S_full, phase = librosa.magphase(librosa.stft(input_values))
+  noise_power = np.mean(S_full[:, :int(sr*0.1)], axis=1)
+  mask = (S_full > noise_power[:, None]).astype(float)
+  mask = medfilt(mask, kernel_size=(1,5))
+  y_clean = librosa.istft(S_full * mask * phase, length=len(input_values))
+  y_clean2 = nr.reduce_noise(y=input_values, sr=sr, stationary=True)
+  return {"medfilt": y_clean, "noisereduce": y_clean2}
+
+#noisereduce on the same STFT settings, in one unpadded chunk (its default 30000-sample chunk padding
+#shifts the frame grid, which changes the output by more than the algorithm does)
+def old_noisereduce_same_stft(input_values):
+  return nr.reduce_noise(y=input_values, sr=sr, stationary=True, n_fft=N_FFT, hop_length=HOP_LENGTH,
+                         padding=0, chunk_size=len(input_values) + 1)
+
+def relative_error(a, b):
+  n = min(len(a), len(b))
+  return np.linalg.norm(a[:n] - b[:n]) / max(np.linalg.norm(a[:n]), 1e-12)
+
+def timed(fn, repeat):
+  times = []
+  for _ in range(repeat):
+    start = time.perf_counter()
+    fn()
+    times.append(time.perf_counter() - start)
+  return np.median(times) * 1000
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser()
+  parser.add_argument("--repeat", type=int, default=5)
+  args = parser.parse_args()
+  for seconds in (5, 20, 60):
+    y = synthetic_clip(seconds)
+    old, new = old_denoise(y), denoise(y, sr)
+    medfilt_diff = relative_error(old["medfilt"], new["medfilt"])
+    nr_diff = relative_error(old_noisereduce_same_stft(y), new["noisereduce"])
+    old_ms = timed(lambda: old_denoise(y), args.repeat)
+    new_ms = timed(lambda: denoise(y, sr), args.repeat)
+    print(f"{seconds:3d} s clip: old {old_ms:8.1f} ms  new {new_ms:8.1f} ms  speedup {old_ms / new_ms:5.2f}x  "
+          f"relative error medfilt {medfilt_diff:.2e}  noisereduce (same STFT) {nr_diff:.2e}")
@@ -0,0 +1,127 @@
+#checks the searchsorted groupPhonemes against the original while loop and times both
+#usage (from backend/): python benchmarks/bench_group_phonemes.py [recorded.jsonl] [--cases N] [--max-words N] [--record OUT]
+#recorded.jsonl holds one {"word_offsets": [...], "char_offsets": [...]} object per line, as returned by
+#wordOffsetGet and batch_decode for real submissions, with the loop's output in "grouped" when it was
+#recorded. Without it only generated cases are checked. --record writes the checked cases with the
+#loop's output to OUT (tests/data/group_phonemes.jsonl is such a file, see tests/test_group_phonemes.py).
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from phoneme import groupPhonemes
+
+PHONEMES = ["p", "b", "t", "d", "k", "ɡ", "f", "v", "θ", "ð", "s", "z", "ʃ", "ʒ", "tʃ", "dʒ", "m", "n", "ŋ", "l",
+            "ɹ", "w", "j", "h", "i", "iː", "ɪ", "e", "ɛ", "æ", "ɑː", "ɔː", "ʊ", "u", "uː", "ʌ", "ə", "ɚ", "aɪ", "aʊ", "ɔɪ"]
+
+#the implementation groupPhonemes replaced
+def group_phonemes_loop(audio_phonemes, word_offsets, char_offsets):
+  grouped_phonemes = []
+  current_word = []
+  word_index = 0
+  char_index = 0
+  next_word_index = 1
+  word_reset_offset = int(word_offsets[word_index]['start_offset'])
+  char_reset_offset = int(char_offsets[char_index]['start_offset'])
+  while char_index < len(char_offsets) and word_index < len(word_offsets):
+      if next_word_index >= len(word_offsets) and char_index < len(char_offsets):
+        current_word.append(char_offsets[char_index]['char'].replace("ː",""))
+        char_index += 1
+      elif word_index < len(word_offsets) and char_index < len(char_offsets):
+        word_start = int(word_offsets[word_index]['start_offset']) - word_reset_offset
+        word_end = int(word_offsets[word_index]['end_offset']) - word_reset_offset
+        next_word_start = int(word_offsets[next_word_index]['start_offset']) - word_reset_offset
+        char_start = int(char_offsets[char_index]['start_offset']) - char_reset_offset
+        char_end = int(char_offsets[char_index]['end_offset']) - char_reset_offset
+        if char_start >= word_start and char_start < next_word_start:
+            current_word.append(char_offsets[char_index]['char'].replace("ː",""))
+            char_index += 1
+        elif char_index < len(char_offsets) and char_start >= word_end:
+            if current_word:
+                grouped_phonemes.append(''.join(current_word))
+                current_word = []
+                word_index += 1
+                next_word_index += 1
+            else:
+              break
+  if current_word:
+      grouped_phonemes.append(''.join(current_word))
+      
+  return grouped_phonemes
+
+#random utterance: words with gaps between them, chars inside (or, with skip_words, some words get none)
+def generated_case(rng, words, skip_words=False):
+  word_offsets, char_offsets = [], []
+  position = int(rng.integers(0, 50))
+  for i in range(words):
+    start = position
+    length = int(rng.integers(3, 40))
+    word_offsets.append({"word": f"w{i}", "start_offset": start, "end_offset": start + length})
+    if not (skip_words and i and rng.random() < 0.1):
+      frames = np.sort(rng.choice(length, size=min(length, int(rng.integers(1, 8))), replace=False))
+      if i == 0:
+        frames[0] = 0
+      for frame in frames:
+        char_offsets.append({"char": str(rng.choice(PHONEMES)), "start_offset": start + int(frame), "end_offset": start + int(frame) + 1})
+    position = start + length + int(rng.integers(0, 10))
+  #both lists are compared relative to their first offset, so a different onset must not matter
+  shift = int(rng.integers(0, 20))
+  for offset in char_offsets:
+    offset["start_offset"] += shift
+    offset["end_offset"] += shift
+  return word_offsets, char_offsets
+
+#what the loop returns for sorted words that do not overlap (it never ends when a char starts past the
+#next word's start but before its own word's end). Offsets are taken relative to the first word and the
+#first char. The loop stops at the first word, other than the last, that no char starts in (from its
+#start up to the next word's start) and drops every char after it, so it returns only the words before
+#that one. For any other input it returns what groupPhonemes returns.
+def loop_output(word_offsets, char_offsets):
+  grouped = groupPhonemes(None, word_offsets, char_offsets)
+  word_starts = np.array([int(offset["start_offset"]) for offset in word_offsets])
+  char_starts = np.array([int(offset["start_offset"]) for offset in char_offsets])
+  words = np.searchsorted(word_starts - word_starts[0], char_starts - char_starts[0], side="right") - 1
+  empty = np.flatnonzero(np.bincount(words, minlength=len(word_offsets))[:-1] == 0)
+  return grouped[:empty[0]] if len(empty) else grouped
+
+#the loop's output and whether it dropped words
+def agrees(word_offsets, char_offsets):
+  expected = loop_output(word_offsets, char_offsets)
+  return group_phonemes_loop(None, word_offsets, char_offsets) == expected, expected != groupPhonemes(None, word_offsets, char_offsets)
+
+def timed(fn, repeat):
+  start = time.perf_counter()
+  for _ in range(repeat):
+    fn()
+  return (time.perf_counter() - start) / repeat * 1e6
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser()
+  parser.add_argument("recorded", nargs="?")
+  parser.add_argument("--cases", type=int, default=2000)
+  parser.add_argument("--max-words", type=int, default=60)
+  parser.add_argument("--record")
+  args = parser.parse_args()
+  rng = np.random.default_rng(0)
+  cases = []
+  if args.recorded:
+    with open(args.recorded, encoding="utf-8") as f:
+      cases += [(record["word_offsets"], record["char_offsets"]) for record in map(json.loads, f) if record["char_offsets"]]
+  cases += [generated_case(rng, int(rng.integers(1, args.max_words)), skip_words=i % 2 == 1) for i in range(args.cases)]
+  results = [agrees(*case) for case in cases]
+  print(f"{len(cases)} cases: {sum(ok for ok, _ in results)} agree, {sum(dropped for _, dropped in results)} where the loop dropped words")
+  if args.record:
+    with open(args.record, "w", encoding="utf-8") as f:
+      for word_offsets, char_offsets in cases:
+        grouped = group_phonemes_loop(None, word_offsets, char_offsets)
+        f.write(json.dumps({"word_offsets": word_offsets, "char_offsets": char_offsets, "grouped": grouped}, ensure_ascii=False) + "\n")
+  for words in (10, 50, 200, 1000):
+    word_offsets, char_offsets = generated_case(rng, words)
+    repeat = max(10, 20000 // words)
+    old_us = timed(lambda: group_phonemes_loop(None, word_offsets, char_offsets), repeat)
+    new_us = timed(lambda: groupPhonemes(None, word_offsets, char_offsets), repeat)
+    print(f"{words:5d} words: loop {old_us:9.1f} us  searchsorted {new_us:9.1f} us  speedup {old_us / new_us:5.2f}x")
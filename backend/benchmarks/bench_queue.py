@@ -0,0 +1,107 @@
+#throughput of the scoring job queue (jobs.claim_job / finish_job) with 1, 2, 4, ... worker processes
+#up to the core count, against a scratch Postgres database (the tables are created there and the
+#benchmark's jobs deleted afterwards). Each job burns a fixed amount of CPU in place of the scoring,
+#so jobs/s should grow linearly with the workers while the queue is not the bottleneck. With --sleep the
+#jobs wait instead, which shows the overhead of the queue itself on a box with fewer cores than workers.
+#usage (from backend/): python benchmarks/bench_queue.py postgresql://.../scratch [--jobs-per-worker N] [--work-ms MS] [--sleep]
+import argparse
+import multiprocessing
+import os
+import sys
+import time
+
+#one core per worker process
+os.environ.setdefault("OMP_NUM_THREADS", "1")
+os.environ.setdefault("OPENBLAS_NUM_THREADS", "1")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+SIGNAL = np.random.default_rng(0).standard_normal(16000).astype(np.float32)
+
+def burn(rounds):
+  for _ in range(rounds):
+    np.fft.irfft(np.fft.rfft(SIGNAL))
+
+#rounds of burn() that take work_ms on one core
+def calibrate(work_ms):
+  start = time.perf_counter()
+  burn(200)
+  return max(1, int(work_ms / ((time.perf_counter() - start) * 1000 / 200)))
+
+def drain(url, name, rounds, sleep, ready):
+  import jobs
+  Session = sessionmaker(bind=create_engine(url, pool_size=1), autoflush=False)
+  ready.wait()
+  with Session() as db:
+    while True:
+      job = jobs.claim_job(db, name)
+      if job is None:
+        break
+      if sleep:
+        time.sleep(sleep)
+      else:
+        burn(rounds)
+      jobs.finish_job(db, job.job_id, name, status="done", result={"worker": name}, audio=None, storage_audio=None)
+
+def queue_jobs(Session, count):
+  import jobs
+  with Session() as db:
+    for _ in range(count):
+      jobs.create_job(db, "bench", None, {}, b"\0" * 64000, b"", None, None)
+
+def clear_jobs(Session):
+  import models
+  with Session() as db:
+    db.query(models.ScoringJob).filter(models.ScoringJob.kind == "bench").delete()
+    db.commit()
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser()
+  parser.add_argument("database_url", help="a scratch database, not the production one")
+  parser.add_argument("--jobs-per-worker", type=int, default=40)
+  parser.add_argument("--work-ms", type=float, default=200, help="CPU time each job stands in for")
+  parser.add_argument("--max-workers", type=int, default=os.cpu_count() or 1)
+  parser.add_argument("--sleep", action="store_true", help="sleep for work-ms instead of using the CPU")
+  args = parser.parse_args()
+
+  import models
+  engine = create_engine(args.database_url)
+  models.Base.metadata.create_all(bind=engine)
+  Session = sessionmaker(bind=engine, autoflush=False)
+  clear_jobs(Session)
+  rounds = 0 if args.sleep else calibrate(args.work_ms)
+  sleep = args.work_ms / 1000 if args.sleep else 0
+  context = multiprocessing.get_context("spawn")
+
+  counts = []
+  n = 1
+  while n < args.max_workers:
+    counts.append(n)
+    n *= 2
+  counts.append(args.max_workers)
+
+  print(f"{'workers':>7} {'jobs':>6} {'seconds':>8} {'jobs/s':>8} {'speedup':>8} {'efficiency':>10}")
+  single = None
+  for workers in counts:
+    total = workers * args.jobs_per_worker
+    queue_jobs(Session, total)
+    ready = context.Barrier(workers + 1)
+    processes = [context.Process(target=drain, args=(args.database_url, f"bench-{i}", rounds, sleep, ready)) for i in range(workers)]
+    for process in processes:
+      process.start()
+    ready.wait()
+    start = time.perf_counter()
+    for process in processes:
+      process.join()
+    seconds = time.perf_counter() - start
+    with Session() as db:
+      done = db.query(models.ScoringJob).filter(models.ScoringJob.kind == "bench", models.ScoringJob.status == "done").count()
+    clear_jobs(Session)
+    assert done == total, f"{done} of {total} jobs finished"
+    rate = total / seconds
+    single = single or rate
+    print(f"{workers:7d} {total:6d} {seconds:8.2f} {rate:8.1f} {rate / single:7.2f}x {rate / single / workers * 100:9.0f}%")
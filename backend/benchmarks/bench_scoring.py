@@ -0,0 +1,67 @@
+#compares the jiwer scoring of a graded submission (the overall wer plus one wer call per word) with
+#scoring.align (one alignment of the whole passage) on generated passages
+#usage (from backend/): python benchmarks/bench_scoring.py [--repeat N]
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from jiwer import wer
+from scoring import align, phoneme_error_rate
+
+PHONEMES = ["p", "b", "t", "d", "k", "ɡ", "f", "v", "θ", "ð", "s", "z", "ʃ", "ʒ", "tʃ", "dʒ", "m", "n", "ŋ", "l",
+            "ɹ", "w", "j", "h", "i", "ɪ", "e", "ɛ", "æ", "ɑ", "ɔ", "ʊ", "u", "ʌ", "ə", "ɚ", "aɪ", "aʊ", "ɔɪ"]
+
+#a reference passage and a reading of it with substituted, dropped and extra phonemes and a dropped word
+def generated_passage(rng, words):
+  reference_words = [[str(p) for p in rng.choice(PHONEMES, size=int(rng.integers(1, 7)))] for _ in range(words)]
+  hypothesis = []
+  for i, word in enumerate(reference_words):
+    if i and rng.random() < 0.03:
+      continue
+    for phoneme in word:
+      roll = rng.random()
+      if roll < 0.08:
+        hypothesis.append(str(rng.choice(PHONEMES)))
+      elif roll < 0.12:
+        continue
+      else:
+        hypothesis.append(phoneme)
+      if rng.random() < 0.03:
+        hypothesis.append(str(rng.choice(PHONEMES)))
+  return reference_words, hypothesis
+
+#what submit_phoneme_assessment did: overall wer on the phonemes, then per word wer by index
+def jiwer_scoring(reference_words, hypothesis, grouped):
+  reference = [p for word in reference_words for p in word]
+  per = wer(' '.join(reference), ' '.join(hypothesis))
+  word_errors = [wer(''.join(word), grouped[i]) for i, word in enumerate(reference_words) if i < len(grouped)]
+  return per, word_errors
+
+def timed(fn, repeat):
+  start = time.perf_counter()
+  for _ in range(repeat):
+    fn()
+  return (time.perf_counter() - start) / repeat * 1000
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser()
+  parser.add_argument("--repeat", type=int, default=20)
+  args = parser.parse_args()
+  rng = np.random.default_rng(0)
+  for words in (20, 100, 400, 1000):
+    reference_words, hypothesis = generated_passage(rng, words)
+    reference = [p for word in reference_words for p in word]
+    #stand-in for the groupPhonemes output the old per word loop compared against
+    grouped = [''.join(word) for word in reference_words]
+    old_per, _ = jiwer_scoring(reference_words, hypothesis, grouped)
+    new_per, rates = align(reference_words, hypothesis)
+    assert abs(old_per - new_per) < 1e-9 and abs(phoneme_error_rate(reference, hypothesis) - new_per) < 1e-9
+    old_ms = timed(lambda: jiwer_scoring(reference_words, hypothesis, grouped), args.repeat)
+    new_ms = timed(lambda: align(reference_words, hypothesis), args.repeat)
+    flagged = sum(rate is not None and rate > 0.5 for rate in rates)
+    print(f"{words:5d} words: PER {new_per * 100:5.1f}% (same as jiwer)  jiwer {old_ms:8.2f} ms  align {new_ms:6.2f} ms  "
+          f"speedup {old_ms / new_ms:6.1f}x  words over 0.5: {flagged}")
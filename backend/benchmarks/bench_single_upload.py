@@ -0,0 +1,59 @@
+#request body size of a submission sent the old way (the recording twice, file and file2) and as a
+#single upload, and the time to send it over a classroom uplink. With --url the submissions are also
+#posted (?job=false) to a running API and the request durations measured, start that API with
+#READSPEAK_DUPLICATE_WINDOW_SECONDS=0 so the repeats are scored instead of answered from the history.
+#usage (from backend/): python benchmarks/bench_single_upload.py recording.wav [--url http://localhost:8000
+#  --student-id N --assessment-id N --stage-id N] [--repeat N]
+import argparse
+import os
+import time
+import urllib.error
+import urllib.request
+import uuid
+
+UPLINKS_MBIT = (1, 5, 20)
+
+def multipart(files):
+  boundary = uuid.uuid4().hex
+  body = b""
+  for field, (name, data) in files.items():
+    body += (f"--{boundary}\r\nContent-Disposition: form-data; name=\"{field}\"; filename=\"{name}\"\r\n"
+             f"Content-Type: application/octet-stream\r\n\r\n").encode() + data + b"\r\n"
+  return body + f"--{boundary}--\r\n".encode(), f"multipart/form-data; boundary={boundary}"
+
+def post(url, body, content_type):
+  request = urllib.request.Request(url, data=body, headers={"Content-Type": content_type}, method="POST")
+  start = time.perf_counter()
+  try:
+    with urllib.request.urlopen(request) as response:
+      response.read()
+  except urllib.error.HTTPError as e:
+    print(f"  {url}: HTTP {e.code} {e.read()[:200]!r}")
+  return (time.perf_counter() - start) * 1000
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser()
+  parser.add_argument("recording")
+  parser.add_argument("--url")
+  parser.add_argument("--student-id", type=int)
+  parser.add_argument("--assessment-id", type=int)
+  parser.add_argument("--stage-id", type=int)
+  parser.add_argument("--repeat", type=int, default=5)
+  args = parser.parse_args()
+  with open(args.recording, "rb") as f:
+    data = f.read()
+  name = os.path.basename(args.recording)
+  bodies = {
+    "file + file2": multipart({"file": (name, data), "file2": (name, data)}),
+    "single upload": multipart({"file": (name, data)}),
+  }
+  print(f"{name}: {len(data) / 1e3:.1f} kB")
+  for label, (body, _) in bodies.items():
+    times = "  ".join(f"{mbit} Mbit/s {len(body) * 8 / (mbit * 1e6) * 1000:7.0f} ms" for mbit in UPLINKS_MBIT)
+    print(f"{label:>14}: {len(body) / 1e3:8.1f} kB on the wire  {times}")
+  if args.url:
+    url = (f"{args.url.rstrip('/')}/submissions/submit/phoneme/?student_id={args.student_id}"
+           f"&assessment_id={args.assessment_id}&stage_id={args.stage_id}&job=false")
+    for label, (body, content_type) in bodies.items():
+      durations = sorted(post(url, body, content_type) for _ in range(args.repeat))
+      print(f"{label:>14}: median request {durations[len(durations) // 2]:7.0f} ms over {args.repeat} requests")
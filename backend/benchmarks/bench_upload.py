@@ -0,0 +1,56 @@
+#wall time of the scoring plus the audio upload of a submission, done one after the other (as the
+#endpoints did) and overlapped (storage.start_upload), with the local storage client standing in for
+#cloudinary at several round trip times. The scoring is a fixed amount of CPU work.
+#usage (from backend/): python benchmarks/bench_upload.py [--scoring-ms MS] [--repeat N]
+import argparse
+import asyncio
+import io
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import storage
+from executors import run_scoring, run_io
+
+SIGNAL = np.random.default_rng(0).standard_normal(16000).astype(np.float32)
+AUDIO = np.random.default_rng(1).integers(0, 256, 400_000, dtype=np.uint8).tobytes()
+
+def score(seconds):
+  end = time.perf_counter() + seconds
+  while time.perf_counter() < end:
+    np.fft.irfft(np.fft.rfft(SIGNAL))
+
+async def sequential(scoring_s):
+  await run_scoring(score, scoring_s)
+  return await run_io(storage.upload_audio, io.BytesIO(AUDIO))
+
+async def overlapped(scoring_s):
+  upload = storage.start_upload(io.BytesIO(AUDIO))
+  await run_scoring(score, scoring_s)
+  return await upload
+
+async def timed(fn, scoring_s, repeat):
+  start = time.perf_counter()
+  for _ in range(repeat):
+    result = await fn(scoring_s)
+    assert result["public_id"]
+  return (time.perf_counter() - start) / repeat * 1000
+
+async def main(args):
+  with tempfile.TemporaryDirectory() as directory:
+    print(f"scoring {args.scoring_ms:.0f} ms, {len(AUDIO) / 1e3:.0f} kB upload")
+    for upload_ms in (50, 200, 500, 1000):
+      storage.set_storage(storage.LocalStorage(directory, latency=upload_ms / 1000))
+      before = await timed(sequential, args.scoring_ms / 1000, args.repeat)
+      after = await timed(overlapped, args.scoring_ms / 1000, args.repeat)
+      print(f"upload {upload_ms:5d} ms: sequential {before:7.1f} ms  overlapped {after:7.1f} ms  saved {before - after:6.1f} ms")
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser()
+  parser.add_argument("--scoring-ms", type=float, default=800)
+  parser.add_argument("--repeat", type=int, default=5)
+  asyncio.run(main(parser.parse_args()))
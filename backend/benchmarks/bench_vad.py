@@ -0,0 +1,56 @@
+#how many model frames voice activity trimming saves on a folder of recordings
+#usage (from backend/): python benchmarks/bench_vad.py [folder]
+#without a folder it runs on synthetic clips with edge silence and pauses
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from vad import trim_silence, FRAME_MS
+
+sr = 16000
+AUDIO_EXTENSIONS = (".wav", ".mp3", ".webm", ".ogg", ".flac", ".m4a")
+
+def synthetic_corpus(count=20):
+  rng = np.random.default_rng(0)
+  for i in range(count):
+    parts = [np.zeros(int(rng.uniform(0.5, 3) * sr))]
+    for _ in range(rng.integers(2, 6)):
+      t = np.arange(int(rng.uniform(0.4, 2) * sr)) / sr
+      parts.append(0.3 * np.sin(2 * np.pi * rng.uniform(120, 300) * t) * np.hanning(len(t)) ** 0.2)
+      parts.append(np.zeros(int(rng.uniform(0.1, 1.5) * sr)))
+    parts.append(np.zeros(int(rng.uniform(0.5, 3) * sr)))
+    y = np.concatenate(parts)
+    yield f"synthetic-{i:02d}", (y + 0.001 * rng.standard_normal(len(y))).astype(np.float32)
+
+def folder_corpus(folder):
+  import librosa
+  for clip in sorted(f for f in os.listdir(folder) if f.lower().endswith(AUDIO_EXTENSIONS)):
+    yield clip, librosa.load(os.path.join(folder, clip), sr=sr)[0]
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser()
+  parser.add_argument("folder", nargs="?")
+  args = parser.parse_args()
+  frame_length = sr * FRAME_MS // 1000
+  total_before = total_after = attention_before = attention_after = 0
+  vad_seconds = 0.0
+  clips = folder_corpus(args.folder) if args.folder else synthetic_corpus()
+  for name, y in clips:
+    start = time.perf_counter()
+    trim = trim_silence(y, sr)
+    vad_seconds += time.perf_counter() - start
+    before = len(y) // frame_length
+    after = len(trim.apply(y)) // frame_length if trim else before
+    total_before += before
+    total_after += after
+    #self-attention cost grows with the square of the frame count
+    attention_before += before ** 2
+    attention_after += after ** 2
+    print(f"{name:30s} {before:6d} -> {after:6d} frames  ({(1 - after / before) * 100:5.1f}% saved)")
+  print(f"\nframes: {total_before} -> {total_after}  ({(1 - total_after / total_before) * 100:.1f}% saved)")
+  print(f"attention cost: {(1 - attention_after / attention_before) * 100:.1f}% saved")
+  print(f"vad time: {vad_seconds * 1000:.1f} ms for {total_before * FRAME_MS / 1000:.1f} s of audio")
@@ -0,0 +1,57 @@
+#compares the old three-call path against audioToPhonemeVariants (one forward pass)
+#usage (from backend/): python benchmarks/bench_variants.py [clip.wav] [--repeat N]
+import argparse
+import os
+import sys
+import time
+
+#measure the forward passes themselves, not the micro-batcher wait
+os.environ.setdefault("READSPEAK_INFERENCE_BATCHING", "0")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import librosa
+import numpy as np
+import noisereduce as nr
+from scipy.signal import medfilt
+from phoneme import audioToPhoneme, audioToPhonemeVariants, prepareInputs, sr
+
+def load_variants(path, seconds):
+  if path:
+    input_values, _ = librosa.load(path, sr=sr)
+  else:
+    rng = np.random.default_rng(0)
+    t = np.arange(int(seconds * sr)) / sr
+    input_values = (0.3 * np.sin(2 * np.pi * 220 * t) + 0.05 * rng.standard_normal(len(t))).astype(np.float32)
+  S_full, phase = librosa.magphase(librosa.stft(input_values))
+  noise_power = np.mean(S_full[:, :int(sr*0.1)], axis=1)
+  mask = (S_full > noise_power[:, None]).astype(float)
+  mask = medfilt(mask, kernel_size=(1,5))
+  y_clean = librosa.istft(S_full * mask * phase, length=len(input_values))
+  y_clean2 = nr.reduce_noise(y=input_values, sr=sr, stationary=True)
+  return [prepareInputs(y) for y in (y_clean, input_values, y_clean2)]
+
+def timed(fn, repeat):
+  times = []
+  for _ in range(repeat):
+    start = time.perf_counter()
+    fn()
+    times.append(time.perf_counter() - start)
+  return np.median(times) * 1000, np.min(times) * 1000
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser()
+  parser.add_argument("clip", nargs="?")
+  parser.add_argument("--seconds", type=float, default=10)
+  parser.add_argument("--repeat", type=int, default=5)
+  args = parser.parse_args()
+  inputs = load_variants(args.clip, args.seconds)
+  #warm up both paths once
+  sequential = [audioToPhoneme(i) for i in inputs]
+  batched = audioToPhonemeVariants(inputs)
+  same = [a[0] == b[0] for a, b in zip(sequential, batched)]
+  seq_med, seq_min = timed(lambda: [audioToPhoneme(i) for i in inputs], args.repeat)
+  bat_med, bat_min = timed(lambda: audioToPhonemeVariants(inputs), args.repeat)
+  print(f"three calls:   median {seq_med:8.1f} ms  min {seq_min:8.1f} ms")
+  print(f"one batch:     median {bat_med:8.1f} ms  min {bat_min:8.1f} ms")
+  print(f"speedup:       {seq_med / bat_med:.2f}x")
+  print(f"transcriptions identical per variant: {same}")
@@ -0,0 +1,109 @@
+#checks that cheap routes stay fast while submissions are being scored.
+#polls GET /user/me/{userId} on its own, then again while --concurrency submissions are in flight,
+#and prints p50/p99 latency for both phases. Every submission sends the clip with its own faint noise
+#added, so none of them is merged with or answered as a duplicate of another (see duplicates.py).
+#The clip has to be readable by soundfile (wav, flac, ogg).
+#usage (API running): python benchmarks/load_latency.py clip.wav --user-id 1 --student-id 2 \
+#  --assessment-id 3 --stage-id 4 [--url http://127.0.0.1:8000]
+import argparse
+import io
+import os
+import statistics
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+import numpy as np
+import soundfile
+
+def percentile(values, q):
+  values = sorted(values)
+  return values[min(len(values) - 1, int(len(values) * q))] * 1000
+
+def encode_multipart(fields):
+  boundary = uuid.uuid4().hex
+  body = b""
+  for name, (filename, data) in fields.items():
+    body += (f"--{boundary}\r\nContent-Disposition: form-data; name=\"{name}\"; filename=\"{filename}\"\r\n"
+             f"Content-Type: application/octet-stream\r\n\r\n").encode() + data + b"\r\n"
+  body += f"--{boundary}--\r\n".encode()
+  return body, f"multipart/form-data; boundary={boundary}"
+
+#the clip with noise at about -90 dBFS, the same speech but a different upload every time
+def variant(y, sample_rate, rng):
+  encoded = io.BytesIO()
+  soundfile.write(encoded, y + rng.standard_normal(y.shape).astype(np.float32) * 3e-5, sample_rate, format="WAV", subtype="PCM_16")
+  return encoded.getvalue()
+
+def probe(url, stop, latencies, interval):
+  while not stop.is_set():
+    start = time.perf_counter()
+    try:
+      urllib.request.urlopen(url, timeout=30).read()
+    except urllib.error.HTTPError:
+      pass
+    latencies.append(time.perf_counter() - start)
+    time.sleep(interval)
+
+def submit(url, body, content_type, durations, errors):
+  request = urllib.request.Request(url, data=body, headers={"Content-Type": content_type}, method="POST")
+  start = time.perf_counter()
+  try:
+    urllib.request.urlopen(request, timeout=300).read()
+  except Exception as e:
+    errors.append(str(e))
+  durations.append(time.perf_counter() - start)
+
+def measure_probe(args, seconds, load=None):
+  latencies = []
+  stop = threading.Event()
+  prober = threading.Thread(target=probe, args=(f"{args.url}/user/me/{args.user_id}", stop, latencies, args.interval))
+  prober.start()
+  if load:
+    load()
+  else:
+    time.sleep(seconds)
+  stop.set()
+  prober.join()
+  return latencies
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser()
+  parser.add_argument("clip")
+  parser.add_argument("--url", default="http://127.0.0.1:8000")
+  parser.add_argument("--user-id", type=int, required=True)
+  parser.add_argument("--student-id", type=int, required=True)
+  parser.add_argument("--assessment-id", type=int, required=True)
+  parser.add_argument("--stage-id", type=int, required=True)
+  parser.add_argument("--concurrency", type=int, default=8)
+  parser.add_argument("--interval", type=float, default=0.05)
+  parser.add_argument("--baseline-seconds", type=float, default=10)
+  args = parser.parse_args()
+
+  y, sample_rate = soundfile.read(args.clip, dtype="float32")
+  rng = np.random.default_rng()
+  name = os.path.splitext(os.path.basename(args.clip))[0] + ".wav"
+  bodies = []
+  for _ in range(args.concurrency):
+    data = variant(y, sample_rate, rng)
+    bodies.append(encode_multipart({"file": (name, data), "file2": (name, data)}))
+  submit_url = (f"{args.url}/submissions/submit/phoneme/?student_id={args.student_id}"
+                f"&assessment_id={args.assessment_id}&stage_id={args.stage_id}")
+
+  idle = measure_probe(args, args.baseline_seconds)
+  durations, errors = [], []
+  def load():
+    workers = [threading.Thread(target=submit, args=(submit_url, body, content_type, durations, errors))
+               for body, content_type in bodies]
+    for w in workers:
+      w.start()
+    for w in workers:
+      w.join()
+  busy = measure_probe(args, 0, load)
+
+  print(f"/user/me idle:     n={len(idle):4d}  p50 {percentile(idle, 0.5):8.1f} ms  p99 {percentile(idle, 0.99):8.1f} ms")
+  print(f"/user/me loaded:   n={len(busy):4d}  p50 {percentile(busy, 0.5):8.1f} ms  p99 {percentile(busy, 0.99):8.1f} ms")
+  print(f"submissions:       n={len(durations):4d}  mean {statistics.mean(durations):8.2f} s  errors {len(errors)}")
+  for e in errors[:5]:
+    print("  ", e)
@@ -0,0 +1,42 @@
+#prints resident memory of a process and its children, split into what each process holds on its own
+#(USS, private pages) and what is shared with the others, from /proc/<pid>/smaps_rollup (Linux only).
+#compare READSPEAK_MMAP_WEIGHTS=0 and =1 with the inference server:
+#  python cli.py inference-server --workers 4 &
+#  python benchmarks/worker_rss.py $!
+import argparse
+import os
+
+def read_rollup(pid):
+  values = {}
+  with open(f"/proc/{pid}/smaps_rollup") as f:
+    for line in f:
+      parts = line.split()
+      if len(parts) >= 3 and parts[2] == "kB":
+        values[parts[0].rstrip(":")] = int(parts[1])
+  return values
+
+def children(pid):
+  found = []
+  for task in os.listdir(f"/proc/{pid}/task"):
+    try:
+      with open(f"/proc/{pid}/task/{task}/children") as f:
+        found.extend(int(c) for c in f.read().split())
+    except FileNotFoundError:
+      pass
+  for child in list(found):
+    found.extend(children(child))
+  return found
+
+if __name__ == "__main__":
+  parser = argparse.ArgumentParser()
+  parser.add_argument("pid", type=int)
+  args = parser.parse_args()
+  print(f"{'pid':>8} {'rss MB':>9} {'pss MB':>9} {'unique MB':>10} {'shared MB':>10}")
+  total_uss = 0
+  for pid in [args.pid] + children(args.pid):
+    v = read_rollup(pid)
+    uss = v.get("Private_Clean", 0) + v.get("Private_Dirty", 0)
+    shared = v.get("Shared_Clean", 0) + v.get("Shared_Dirty", 0)
+    total_uss += uss
+    print(f"{pid:>8} {v.get('Rss', 0) / 1024:9.1f} {v.get('Pss', 0) / 1024:9.1f} {uss / 1024:10.1f} {shared / 1024:10.1f}")
+  print(f"total unique: {total_uss / 1024:.1f} MB")
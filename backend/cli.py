@@ -0,0 +1,246 @@
+#maintenance commands, run from backend/: python cli.py <command> --help
+import argparse
+import os
+import sys
+import time
+
+AUDIO_EXTENSIONS = (".wav", ".mp3", ".webm", ".ogg", ".flac", ".m4a")
+
+#replays a folder of recordings through two backends and compares phoneme error rate and speed.
+#a clip's reference is the text in <clip>.txt when present, otherwise the baseline's own output
+def evaluate_backend(args):
+  os.environ["READSPEAK_INFERENCE_BACKEND"] = args.baseline
+  os.environ["READSPEAK_INFERENCE_BATCHING"] = "0"
+  import librosa
+  from jiwer import wer
+  from transformers import Wav2Vec2ForCTC
+  from backends import load_backend
+  from config import PHONEME_CHECKPOINT
+  import phoneme
+  from phoneme import prepareInputs, sr, forwardBatch, logitsToPhoneme, textToPhoneme
+
+  phoneme.loadModels()
+  backends = {args.baseline: phoneme.model, args.candidate: load_backend(args.candidate, PHONEME_CHECKPOINT, Wav2Vec2ForCTC)}
+  clips = sorted(f for f in os.listdir(args.folder) if f.lower().endswith(AUDIO_EXTENSIONS))
+  if not clips:
+    sys.exit(f"No audio clips found in {args.folder}")
+  totals = {name: {"per": 0.0, "seconds": 0.0} for name in backends}
+  audio_seconds = 0.0
+  for clip in clips:
+    path = os.path.join(args.folder, clip)
+    input_values, _ = librosa.load(path, sr=sr)
+    audio_seconds += len(input_values) / sr
+    values = prepareInputs(input_values)["input_values"][0]
+    outputs = {}
+    for name, backend in backends.items():
+      start = time.perf_counter()
+      logits = forwardBatch(backend, [values])[0]
+      totals[name]["seconds"] += time.perf_counter() - start
+      outputs[name] = logitsToPhoneme(logits)[2]
+    text_path = os.path.splitext(path)[0] + ".txt"
+    if os.path.exists(text_path):
+      with open(text_path, encoding="utf-8") as f:
+        reference = textToPhoneme(f.read())[1]
+    else:
+      reference = outputs[args.baseline]
+    line = [clip]
+    for name in backends:
+      per = wer(' '.join(reference), ' '.join(outputs[name])) if reference else 0.0
+      totals[name]["per"] += per
+      line.append(f"{name} PER {per*100:6.2f}%")
+    print("  ".join(line))
+
+  print(f"\n{len(clips)} clips, {audio_seconds:.1f} s of audio")
+  for name, total in totals.items():
+    print(f"{name:>8}: mean PER {total['per'] / len(clips) * 100:6.2f}%  "
+          f"inference {total['seconds']:.2f} s  ({audio_seconds / total['seconds']:.1f}x real time)")
+  base, cand = totals[args.baseline], totals[args.candidate]
+  print(f"PER delta ({args.candidate} - {args.baseline}): {(cand['per'] - base['per']) / len(clips) * 100:+.2f} points")
+  print(f"speedup: {base['seconds'] / cand['seconds']:.2f}x")
+
+#exports the phoneme model (and the word model with --word-model) to ONNX for the onnx backend,
+#using only the weights already in the local Hugging Face cache
+def export_onnx(args):
+  os.environ["HF_HUB_OFFLINE"] = "1"
+  from transformers import Wav2Vec2ForCTC, AutoModelForCTC
+  from backends import export_onnx
+  from config import PHONEME_CHECKPOINT, WORD_CHECKPOINT
+
+  targets = [(PHONEME_CHECKPOINT, Wav2Vec2ForCTC)]
+  if args.word_model:
+    targets.append((WORD_CHECKPOINT, AutoModelForCTC))
+  for checkpoint, model_class in targets:
+    start = time.perf_counter()
+    path = export_onnx(checkpoint, model_class, args.opset)
+    print(f"{checkpoint} -> {path} ({time.perf_counter() - start:.1f} s)")
+
+#saves the checkpoints (processor and safetensors weights) under MODEL_DIR, after this the
+#models load from disk with no network access and the torch backend can mmap the weights
+def fetch_models(args):
+  from transformers import Wav2Vec2Processor, Wav2Vec2ForCTC, AutoProcessor, AutoModelForCTC
+  from backends import local_model_dir
+  from config import PHONEME_CHECKPOINT, WORD_CHECKPOINT
+
+  targets = [(PHONEME_CHECKPOINT, Wav2Vec2Processor, Wav2Vec2ForCTC)]
+  if args.word_model:
+    targets.append((WORD_CHECKPOINT, AutoProcessor, AutoModelForCTC))
+  for checkpoint, processor_class, model_class in targets:
+    path = local_model_dir(checkpoint)
+    processor_class.from_pretrained(checkpoint).save_pretrained(path)
+    model_class.from_pretrained(checkpoint).save_pretrained(path, safe_serialization=True)
+    print(f"{checkpoint} -> {path}")
+
+#runs the model-holding worker processes that API workers in remote inference mode talk to
+def inference_server(args):
+  import logging
+  logging.basicConfig(level=logging.INFO)
+  os.environ["READSPEAK_INFERENCE_MODE"] = "local"
+  #each worker only gets its share of the cores, see inference_server.serve
+  os.environ.setdefault("READSPEAK_ORT_THREADS", str(max(1, (os.cpu_count() or 1) // args.workers)))
+  from config import INFERENCE_ADDRESS
+  from inference_server import serve
+  serve(args.address or INFERENCE_ADDRESS, args.workers)
+
+#converts every word of the saved assessments so the lexicon table (and this process's cache) has them
+def warm_lexicon(args):
+  import models
+  from database import SessionLocal
+  from phoneme import lexicon
+  with SessionLocal() as db:
+    texts = [text for (text,) in db.query(models.PronunciationAssessment.text_content).all() if text]
+  words = list(dict.fromkeys(word for text in texts for word in text.split()))
+  start = time.perf_counter()
+  for i in range(0, len(words), args.batch):
+    lexicon.lookup(words[i:i + args.batch])
+  stats = lexicon.stats()
+  print(f"{len(texts)} assessments, {len(words)} distinct words in {time.perf_counter() - start:.1f} s")
+  print(f"already in the lexicon table: {stats['db_hits']}, converted with gruut: {stats['converted']}")
+
+#fills PronunciationAssessment.word_index for the assessments saved before it existed
+def index_assessments(args):
+  import models
+  from database import SessionLocal
+  from phoneme import wordIndex
+  with SessionLocal() as db:
+    assessments = db.query(models.PronunciationAssessment).filter(models.PronunciationAssessment.word_index.is_(None)).all()
+    for assessment in assessments:
+      assessment.word_index = wordIndex(assessment.text_content or "")
+    db.commit()
+  print(f"indexed {len(assessments)} assessments")
+
+#claims and scores submission jobs from the database, run one per inference box (or several with
+#fewer --concurrency each). Importing main configures cloudinary and creates the tables.
+def worker(args):
+  import asyncio
+  import logging
+  logging.basicConfig(level=logging.INFO)
+  from config import SCORING_WORKERS
+  from phoneme import loadModels
+  from jobs import work
+  from storage import flush_spool_forever
+  from main import submissionRoutes
+  loadModels()
+
+  async def run():
+    spool = asyncio.get_running_loop().create_task(flush_spool_forever())
+    await work(submissionRoutes.JOB_HANDLERS, args.concurrency or SCORING_WORKERS, args.name)
+  asyncio.run(run())
+
+#re-encodes the recordings of submissions older than --older-than-days to Opus (see archive.py) with a
+#process pool, points their history rows at the Opus files and deletes the originals. Set
+#READSPEAK_STORAGE=local to try it against files on disk.
+def archive_audio(args):
+  from concurrent.futures import ProcessPoolExecutor, as_completed
+  from datetime import datetime, timedelta
+  import pytz
+  import main  #configures cloudinary
+  from database import SessionLocal
+  from config import STORAGE_BACKEND, ARCHIVE_OPUS_KBPS
+  from storage import HISTORY_MODELS
+  from archive import archive_recording, save_archived, cloudinary_settings, configure_worker
+
+  before = datetime.now(pytz.timezone("Asia/Manila")) - timedelta(days=args.older_than_days)
+  with SessionLocal() as db:
+    rows = []
+    for kind, model in HISTORY_MODELS.items():
+      query = db.query(model.history_id, model.audio_url, model.audio_public_id).filter(
+        model.audio_url.isnot(None), model.archive_bytes.is_(None), model.date_taken < before).order_by(model.date_taken)
+      rows += [(kind, *row) for row in (query.limit(args.limit) if args.limit else query).all()]
+  print(f"{len(rows)} recordings to archive")
+
+  settings = cloudinary_settings() if STORAGE_BACKEND == "cloudinary" else None
+  totals = {"archived": 0, "kept": 0, "changed": 0, "failed": 0, "original_bytes": 0, "archive_bytes": 0}
+  start = time.perf_counter()
+  with ProcessPoolExecutor(max_workers=args.workers, initializer=configure_worker, initargs=(settings,)) as pool, SessionLocal() as db:
+    futures = {pool.submit(archive_recording, kind, history_id, audio_url, args.kbps or ARCHIVE_OPUS_KBPS): (kind, history_id, audio_url, public_id)
+               for kind, history_id, audio_url, public_id in rows}
+    for future in as_completed(futures):
+      kind, history_id, audio_url, public_id = futures[future]
+      #one failed recording (download, transcode, database or storage call) must not end the run, the
+      #transcodes still in the pool would be uploaded without their rows being updated
+      try:
+        result = future.result()
+        outcome = save_archived(db, HISTORY_MODELS[kind], result, audio_url, public_id)
+      except Exception as e:
+        db.rollback()
+        totals["failed"] += 1
+        print(f"{kind} {history_id}: {e}")
+        continue
+      totals[outcome] += 1
+      if outcome in ("archived", "kept"):
+        totals["original_bytes"] += result["original_bytes"]
+        totals["archive_bytes"] += result["archive_bytes"]
+  saved = totals["original_bytes"] - totals["archive_bytes"]
+  print(f"archived {totals['archived']}, kept as they were {totals['kept']}, changed meanwhile {totals['changed']}, "
+        f"failed {totals['failed']} in {time.perf_counter() - start:.1f} s")
+  print(f"{totals['original_bytes'] / 1e6:.1f} MB -> {totals['archive_bytes'] / 1e6:.1f} MB, saved {saved / 1e6:.1f} MB"
+        + (f" ({saved / totals['original_bytes'] * 100:.0f}%)" if totals["original_bytes"] else ""))
+
+def main():
+  parser = argparse.ArgumentParser(description="ReadSpeak maintenance commands")
+  commands = parser.add_subparsers(dest="command", required=True)
+
+  evaluate = commands.add_parser("evaluate-backend", help="compare PER and speed of two inference backends on recorded clips")
+  evaluate.add_argument("folder")
+  evaluate.add_argument("--baseline", default="torch")
+  evaluate.add_argument("--candidate", default="int8")
+  evaluate.set_defaults(func=evaluate_backend)
+
+  export = commands.add_parser("export-onnx", help="export the models to ONNX from the local Hugging Face cache")
+  export.add_argument("--word-model", action="store_true", help="also export the word-offset model")
+  export.add_argument("--opset", type=int, default=17)
+  export.set_defaults(func=export_onnx)
+
+  fetch = commands.add_parser("fetch-models", help="download the checkpoints once and save them under READSPEAK_MODEL_DIR")
+  fetch.add_argument("--word-model", action="store_true", help="also fetch the word-offset model")
+  fetch.set_defaults(func=fetch_models)
+
+  server = commands.add_parser("inference-server", help="serve the models to API workers running in remote inference mode")
+  server.add_argument("--workers", type=int, default=2)
+  server.add_argument("--address", help="unix socket path, defaults to READSPEAK_INFERENCE_ADDRESS")
+  server.set_defaults(func=inference_server)
+
+  warm = commands.add_parser("warm-lexicon", help="preload the lexicon table with every word of the saved assessments")
+  warm.add_argument("--batch", type=int, default=500, help="words converted and saved per round trip")
+  warm.set_defaults(func=warm_lexicon)
+
+  index = commands.add_parser("index-assessments", help="save the per word reference of assessments that do not have one yet")
+  index.set_defaults(func=index_assessments)
+
+  jobs = commands.add_parser("worker", help="score queued submission jobs, any number of boxes can run one")
+  jobs.add_argument("--concurrency", type=int, help="jobs scored at once, defaults to READSPEAK_SCORING_WORKERS")
+  jobs.add_argument("--name", help="worker name saved on the jobs it claims, defaults to host:pid")
+  jobs.set_defaults(func=worker)
+
+  archive = commands.add_parser("archive-audio", help="re-encode the recordings of older submissions to low bitrate Opus")
+  archive.add_argument("--older-than-days", type=int, default=30)
+  archive.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+  archive.add_argument("--kbps", type=int, help="Opus bitrate, defaults to READSPEAK_ARCHIVE_OPUS_KBPS")
+  archive.add_argument("--limit", type=int, help="at most this many recordings of each kind")
+  archive.set_defaults(func=archive_audio)
+
+  args = parser.parse_args()
+  args.func(args)
+
+if __name__ == "__main__":
+  main()
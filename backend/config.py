@@ -0,0 +1,118 @@
+import os
+
+def _flag(name, default):
+  return os.environ.get(name, default).lower() in ("1", "true", "yes", "on")
+
+#inference micro-batching, see batching.py
+#requests arriving within BATCH_MAX_WAIT_MS of each other share one forward pass
+INFERENCE_BATCHING = _flag("READSPEAK_INFERENCE_BATCHING", "1")
+BATCH_MAX_SIZE = int(os.environ.get("READSPEAK_BATCH_MAX_SIZE", "8"))
+BATCH_MAX_WAIT_MS = float(os.environ.get("READSPEAK_BATCH_MAX_WAIT_MS", "10"))
+
+#where word boundaries come from: "forced" aligns the reference phonemes against the phoneme
+#model's logits, "model" runs the separate wav2vec2-large-960h word model
+WORD_OFFSET_MODE = os.environ.get("READSPEAK_WORD_OFFSETS", "forced")
+
+PHONEME_CHECKPOINT = "facebook/wav2vec2-lv-60-espeak-cv-ft"
+WORD_CHECKPOINT = "facebook/wav2vec2-large-960h-lv60-self"
+
+#"torch" runs the fp32 checkpoints, "int8" applies dynamic int8 quantization to the Linear layers
+#and caches the quantized weights under MODEL_CACHE_DIR, "onnx" runs the graphs exported by
+#"python cli.py export-onnx" with ONNX Runtime
+INFERENCE_BACKEND = os.environ.get("READSPEAK_INFERENCE_BACKEND", "torch")
+MODEL_CACHE_DIR = os.environ.get("READSPEAK_MODEL_CACHE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "model_cache"))
+ORT_INTRA_OP_THREADS = int(os.environ.get("READSPEAK_ORT_THREADS", str(os.cpu_count() or 1)))
+
+#load the models in a background thread at API startup, otherwise on the first scoring request
+PRELOAD_MODELS = _flag("READSPEAK_PRELOAD_MODELS", "1")
+
+#executors for the blocking parts of the submission endpoints, see executors.py
+SCORING_WORKERS = int(os.environ.get("READSPEAK_SCORING_WORKERS", str(max(1, (os.cpu_count() or 2) // 2))))
+SCORING_QUEUE_LIMIT = int(os.environ.get("READSPEAK_SCORING_QUEUE_LIMIT", "64"))
+IO_WORKERS = int(os.environ.get("READSPEAK_IO_WORKERS", "16"))
+
+#"local" runs the models in this process, "remote" sends the forward passes to the inference
+#server ("python cli.py inference-server") over the unix socket at INFERENCE_ADDRESS
+INFERENCE_MODE = os.environ.get("READSPEAK_INFERENCE_MODE", "local")
+INFERENCE_ADDRESS = os.environ.get("READSPEAK_INFERENCE_ADDRESS", "/tmp/readspeak-inference.sock")
+
+#local copies of the checkpoints ("python cli.py fetch-models"), used instead of the Hub when present.
+#with MMAP_WEIGHTS the fp32 torch backend maps the safetensors file instead of copying it into each process
+MODEL_DIR = os.environ.get("READSPEAK_MODEL_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "local_models"))
+MMAP_WEIGHTS = _flag("READSPEAK_MMAP_WEIGHTS", "1")
+
+#which denoise variants the graded submissions score: "all" scores raw, medfilt and noisereduce and
+#keeps the best, "adaptive" scores only what denoise.select_variants picks from the clip's SNR and
+#noise stationarity, "shadow" scores all three but logs and counts how often the adaptive pick would
+#have matched the best one (see /metrics/variants). Shadow grades like "all" and never exits early, it
+#stays the default until the SELECT_* thresholds below and EARLY_EXIT_SCORE are tuned on its logs.
+VARIANT_SELECTION = os.environ.get("READSPEAK_VARIANT_SELECTION", "shadow")
+SELECT_CLEAN_SNR_DB = float(os.environ.get("READSPEAK_SELECT_CLEAN_SNR_DB", "25"))
+SELECT_NOISY_SNR_DB = float(os.environ.get("READSPEAK_SELECT_NOISY_SNR_DB", "10"))
+SELECT_STATIONARY_SPREAD_DB = float(os.environ.get("READSPEAK_SELECT_STATIONARY_SPREAD_DB", "3"))
+
+#score the raw clip on its own first and skip the denoised variants when it already scores at least
+#EARLY_EXIT_SCORE (1 - PER against the assessment's phonemes)
+EARLY_EXIT = _flag("READSPEAK_EARLY_EXIT", "1")
+EARLY_EXIT_SCORE = float(os.environ.get("READSPEAK_EARLY_EXIT_SCORE", "0.9"))
+
+#a word of a graded submission becomes a practice word when its phoneme error rate (scoring.align)
+#is above this. Before the per word alignment the 0.5 applied to a whole word wer, so any wrong word
+#was flagged, now a word is flagged when more than half of its phonemes are wrong.
+PRACTICE_WORD_ERROR = float(os.environ.get("READSPEAK_PRACTICE_WORD_ERROR", "0.5"))
+
+#voice activity trimming before the model, see vad.py. Frames more than VAD_MARGIN_DB above the
+#clip's noise floor are speech, clips whose loudest frame is less than VAD_MIN_SNR_DB above the floor
+#are left alone. Edge silence is cut down to VAD_PAD_MS and longer pauses to VAD_MAX_PAUSE_MS.
+VAD = _flag("READSPEAK_VAD", "1")
+VAD_MARGIN_DB = float(os.environ.get("READSPEAK_VAD_MARGIN_DB", "6"))
+VAD_MIN_SNR_DB = float(os.environ.get("READSPEAK_VAD_MIN_SNR_DB", "15"))
+VAD_PAD_MS = int(os.environ.get("READSPEAK_VAD_PAD_MS", "150"))
+VAD_MAX_PAUSE_MS = int(os.environ.get("READSPEAK_VAD_MAX_PAUSE_MS", "400"))
+
+#grapheme to phoneme cache, see lexicon.py. LEXICON_CACHE_SIZE words are kept in memory, with
+#LEXICON_DB the lexicon table is the second tier shared between workers
+LEXICON_CACHE_SIZE = int(os.environ.get("READSPEAK_LEXICON_CACHE_SIZE", "50000"))
+LEXICON_DB = _flag("READSPEAK_LEXICON_DB", "1")
+
+#float16 log posteriors of the phoneme model kept on disk per model input, see posteriors.py
+POSTERIOR_CACHE = _flag("READSPEAK_POSTERIOR_CACHE", "1")
+POSTERIOR_CACHE_DIR = os.environ.get("READSPEAK_POSTERIOR_CACHE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "posterior_cache"))
+POSTERIOR_CACHE_BYTES = int(os.environ.get("READSPEAK_POSTERIOR_CACHE_BYTES", str(2 * 1024 ** 3)))
+
+#a submission repeating one saved in the last DUPLICATE_WINDOW_SECONDS (same upload, or same
+#Idempotency-Key header) returns the saved result, see duplicates.py. 0 turns it off, including the
+#merging of repeats that arrive while the first is still being scored.
+DUPLICATE_WINDOW_SECONDS = int(os.environ.get("READSPEAK_DUPLICATE_WINDOW_SECONDS", "600"))
+
+#submissions return a job id right away and are scored in the background (see jobs.py), the result
+#is read from GET /submissions/jobs/{id} or its event stream. Off by default so submissions keep the
+#synchronous response, a request can ask for either with ?job=true or ?job=false. JOB_POLL_SECONDS is
+#how often the event stream reads the job.
+SUBMISSION_JOBS = _flag("READSPEAK_SUBMISSION_JOBS", "0")
+JOB_POLL_SECONDS = float(os.environ.get("READSPEAK_JOB_POLL_SECONDS", "0.5"))
+
+#a worker holds a claimed job for JOB_LEASE_SECONDS (renewed while it runs), after that the job is
+#claimed again by another worker. Jobs failing with a server error are tried up to JOB_MAX_ATTEMPTS
+#times. JOB_WORKER_IN_API runs a worker in every API process that queues jobs (all of them with
+#SUBMISSION_JOBS on), turn it off on API boxes when the scoring is left to "python cli.py worker" on
+#inference boxes.
+JOB_LEASE_SECONDS = int(os.environ.get("READSPEAK_JOB_LEASE_SECONDS", "120"))
+JOB_MAX_ATTEMPTS = int(os.environ.get("READSPEAK_JOB_MAX_ATTEMPTS", "3"))
+JOB_WORKER_IN_API = _flag("READSPEAK_JOB_WORKER_IN_API", "1")
+
+#where the submitted recordings are uploaded, "cloudinary" or "local" (files under STORAGE_DIR, for
+#tests and benchmarks), see storage.py. Uploads failing STORAGE_RETRIES times are kept in
+#STORAGE_SPOOL_DIR and tried again every STORAGE_SPOOL_RETRY_SECONDS.
+STORAGE_BACKEND = os.environ.get("READSPEAK_STORAGE", "cloudinary")
+STORAGE_DIR = os.environ.get("READSPEAK_STORAGE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "local_storage"))
+STORAGE_RETRIES = int(os.environ.get("READSPEAK_STORAGE_RETRIES", "3"))
+STORAGE_SPOOL_DIR = os.environ.get("READSPEAK_STORAGE_SPOOL_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "audio_spool"))
+STORAGE_SPOOL_RETRY_SECONDS = int(os.environ.get("READSPEAK_STORAGE_SPOOL_RETRY_SECONDS", "60"))
+
+#with a single upload submission (no file2) the stored recording is the scored one, "flac" stores wav
+#uploads as FLAC, empty stores them as uploaded
+STORAGE_ENCODING = os.environ.get("READSPEAK_STORAGE_ENCODING", "flac")
+
+#bitrate of the Opus files the archive tier ("python cli.py archive-audio", see archive.py) stores
+ARCHIVE_OPUS_KBPS = int(os.environ.get("READSPEAK_ARCHIVE_OPUS_KBPS", "24"))
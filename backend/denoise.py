@@ -0,0 +1,96 @@
+import librosa
+import numpy as np
+from scipy.signal import fftconvolve
+from config import SELECT_CLEAN_SNR_DB, SELECT_NOISY_SNR_DB, SELECT_STATIONARY_SPREAD_DB
+
+#The cleaned-up versions of a recording that get scored next to the raw audio. Both come from one
+#STFT of the clip: "medfilt" is the spectral gate the submission endpoints always used, "noisereduce"
+#is noisereduce's stationary spectral gating (reduce_noise(stationary=True)) recomputed on the same
+#spectrogram instead of running its own STFT.
+
+N_FFT = 2048
+HOP_LENGTH = N_FFT // 4
+
+#noisereduce's stationary defaults
+NR_STD_THRESH = 1.5
+NR_TOP_DB = 80.0
+NR_FREQ_SMOOTH_HZ = 500
+NR_TIME_SMOOTH_MS = 50
+
+class Spectrogram:
+  def __init__(self, y, sr):
+    self.y = y
+    self.sr = sr
+    self.magnitude, self.phase = librosa.magphase(librosa.stft(y, n_fft=N_FFT, hop_length=HOP_LENGTH))
+
+  def resynthesize(self, mask):
+    return librosa.istft(self.magnitude * mask * self.phase, hop_length=HOP_LENGTH, length=len(self.y))
+
+#median over a window of `width` frames along time of a boolean mask, zero padded at the edges like
+#scipy.signal.medfilt. On 0/1 values the median is a majority vote, so it is a running count from a
+#cumulative sum instead of sorting every window.
+def running_median(mask, width=5):
+  half = width // 2
+  padded = np.pad(mask, ((0, 0), (half + 1, half))).astype(np.int32)
+  counts = np.cumsum(padded, axis=1)
+  return (counts[:, width:] - counts[:, :-width]) > half
+
+def spectral_gate(spec):
+  S_full = spec.magnitude
+  noise_power = np.mean(S_full[:, :int(spec.sr*0.1)], axis=1)
+  mask = running_median(S_full > noise_power[:, None], 5)
+  return spec.resynthesize(mask)
+
+def _smoothing_filter(n_grad_freq, n_grad_time):
+  freq = np.concatenate([np.linspace(0, 1, n_grad_freq + 1, endpoint=False), np.linspace(1, 0, n_grad_freq + 2)])[1:-1]
+  time = np.concatenate([np.linspace(0, 1, n_grad_time + 1, endpoint=False), np.linspace(1, 0, n_grad_time + 2)])[1:-1]
+  smoothing = np.outer(freq, time)
+  return smoothing / np.sum(smoothing)
+
+def noise_reduce(spec):
+  S_full = spec.magnitude
+  #per frequency noise threshold from the statistics of the whole clip, in dB
+  db = 20 * np.log10(S_full + np.finfo(np.float64).eps)
+  db = np.maximum(db, db.max(axis=1, keepdims=True) - NR_TOP_DB)
+  thresh = db.mean(axis=1) + db.std(axis=1) * NR_STD_THRESH
+  mask = (db > thresh[:, None]).astype(np.float32)
+  n_grad_freq = int(NR_FREQ_SMOOTH_HZ / (spec.sr / (N_FFT / 2)))
+  n_grad_time = int(NR_TIME_SMOOTH_MS / (HOP_LENGTH / spec.sr * 1000))
+  if n_grad_freq > 1 or n_grad_time > 1:
+    mask = fftconvolve(mask, _smoothing_filter(n_grad_freq, n_grad_time), mode="same")
+  return spec.resynthesize(mask).astype(spec.y.dtype)
+
+#cheap statistics of the clip taken from the spectrogram, used to pick the variants worth scoring.
+#snr_db compares the loud frames with the quiet ones, noise_spread_db is how much the noise floor
+#moves between one second segments (low for hiss and hum, high for chatter and traffic)
+def analyze(spec, segment_seconds=1.0):
+  power = np.mean(spec.magnitude ** 2, axis=0) + 1e-12
+  floor, level = np.percentile(power, [10, 95])
+  frames = max(1, int(segment_seconds * spec.sr / HOP_LENGTH))
+  floors = 10 * np.log10([np.percentile(power[i:i + frames], 10) for i in range(0, len(power), frames)])
+  spread = np.subtract(*np.percentile(floors, [75, 25])) if len(floors) > 1 else 0.0
+  return {"snr_db": float(10 * np.log10(level / floor)), "noise_spread_db": float(spread)}
+
+#which of raw/medfilt/noisereduce to score: clean clips only need the raw audio, noisy ones only the
+#denoiser that suits the noise (noisereduce assumes stationary noise, the spectral gate does not),
+#and in between the raw audio and that denoiser are both scored
+def select_variants(analysis):
+  denoiser = "noisereduce" if analysis["noise_spread_db"] <= SELECT_STATIONARY_SPREAD_DB else "medfilt"
+  if analysis["snr_db"] >= SELECT_CLEAN_SNR_DB:
+    return ["raw"]
+  if analysis["snr_db"] <= SELECT_NOISY_SNR_DB:
+    return [denoiser]
+  return [name for name in VARIANT_ORDER if name in ("raw", denoiser)]
+
+#also the tie-break order when two variants score the same
+VARIANT_ORDER = ("medfilt", "raw", "noisereduce")
+
+VARIANTS = {
+  "medfilt": spectral_gate,
+  "noisereduce": noise_reduce,
+}
+
+#returns {name: waveform} for the requested variants, sharing one STFT between them
+def denoise(y, sr, variants=("medfilt", "noisereduce")):
+  spec = Spectrogram(y, sr)
+  return {name: VARIANTS[name](spec) for name in variants}
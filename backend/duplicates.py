@@ -0,0 +1,62 @@
+import asyncio
+import hashlib
+from datetime import datetime, timedelta
+import pytz
+from sqlalchemy import or_
+from config import DUPLICATE_WINDOW_SECONDS
+from phoneme import modelVersion
+
+#Repeated submissions (double taps, client retries after a slow response) get the result of the first
+#one instead of being scored and uploaded again. A submission is the same when it is for the same
+#assessment or practice word and its upload hashes the same under the same model or it carries the
+#same Idempotency-Key header, within DUPLICATE_WINDOW_SECONDS. Saved results are found in the history
+#tables, a repeat arriving while the first is still being scored waits for it (see single_flight).
+
+_inflight = {}
+
+#sha256 of the model version, the kind of submission, the assessment or practice id and the upload
+def audio_fingerprint(audio_file, kind, target_id):
+  digest = hashlib.sha256(f"{modelVersion('phoneme')}:{kind}:{target_id}:".encode())
+  audio_file.seek(0)
+  for chunk in iter(lambda: audio_file.read(1 << 20), b""):
+    digest.update(chunk)
+  audio_file.seek(0)
+  return digest.hexdigest()
+
+#the student's latest history row in the window for the same assessment or practice word (target maps
+#the history columns to their ids) with the same fingerprint or idempotency key
+def find_duplicate(db, history_model, student_id, target, audio_hash, idempotency_key=None):
+  if DUPLICATE_WINDOW_SECONDS <= 0:
+    return None
+  since = datetime.now(pytz.timezone("Asia/Manila")) - timedelta(seconds=DUPLICATE_WINDOW_SECONDS)
+  matches = [history_model.audio_hash == audio_hash]
+  if idempotency_key:
+    matches.append(history_model.idempotency_key == idempotency_key)
+  return db.query(history_model).filter(
+    history_model.student_id == student_id,
+    history_model.date_taken >= since,
+    *[getattr(history_model, column) == value for column, value in target.items()],
+    or_(*matches),
+  ).order_by(history_model.date_taken.desc()).first()
+
+#runs make() once per key in this worker, callers arriving while it runs get the same result
+async def single_flight(key, make):
+  if DUPLICATE_WINDOW_SECONDS <= 0:
+    return await make()
+  future = _inflight.get(key)
+  if future is not None:
+    return await asyncio.shield(future)
+  future = asyncio.get_running_loop().create_future()
+  _inflight[key] = future
+  try:
+    result = await make()
+  except BaseException as e:
+    future.set_exception(e)
+    #nobody may be waiting, do not warn about an unretrieved exception
+    future.exception()
+    raise
+  else:
+    future.set_result(result)
+    return result
+  finally:
+    del _inflight[key]
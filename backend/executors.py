@@ -0,0 +1,40 @@
+import asyncio
+import contextlib
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from fastapi import HTTPException
+from config import SCORING_WORKERS, SCORING_QUEUE_LIMIT, IO_WORKERS
+
+#The submission endpoints are async, so anything blocking they do has to run somewhere else or it
+#freezes every other request on the worker. Audio decoding, denoising, inference and scoring go to
+#the small scoring pool, database calls and uploads go to the io pool.
+scoring_executor = ThreadPoolExecutor(max_workers=SCORING_WORKERS, thread_name_prefix="scoring")
+io_executor = ThreadPoolExecutor(max_workers=IO_WORKERS, thread_name_prefix="blocking-io")
+
+#the scoring pool only queues up to SCORING_QUEUE_LIMIT jobs, past that new submissions are turned away
+_scoring_slots = threading.BoundedSemaphore(SCORING_QUEUE_LIMIT)
+
+#a place in the scoring queue. The submission endpoints take it before starting the upload, so a
+#submission that is turned away costs no upload.
+@contextlib.contextmanager
+def scoring_slot():
+  if not _scoring_slots.acquire(blocking=False):
+    raise HTTPException(status_code=503, detail='Server is busy scoring other submissions, please try again.')
+  try:
+    yield
+  finally:
+    _scoring_slots.release()
+
+#runs fn on the scoring pool, the caller holds a scoring_slot
+async def run_in_scoring_pool(fn, *args, **kwargs):
+  loop = asyncio.get_running_loop()
+  return await loop.run_in_executor(scoring_executor, functools.partial(fn, *args, **kwargs))
+
+async def run_scoring(fn, *args, **kwargs):
+  with scoring_slot():
+    return await run_in_scoring_pool(fn, *args, **kwargs)
+
+async def run_io(fn, *args, **kwargs):
+  loop = asyncio.get_running_loop()
+  return await loop.run_in_executor(io_executor, functools.partial(fn, *args, **kwargs))
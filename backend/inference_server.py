@@ -0,0 +1,92 @@
+import logging
+import multiprocessing
+import os
+import sys
+import threading
+from multiprocessing.connection import Listener, Client
+import numpy as np
+
+#A pool of model-holding processes shared by every API worker on the box. The API workers run with
+#READSPEAK_INFERENCE_MODE=remote and hold no model state, they send the unpadded 1-D input_values
+#here and get the logits back. Arrays are sent as raw buffers (one message per array, no pickling)
+#and read back with np.frombuffer, only the small header is pickled.
+#Every worker process accepts on the same unix socket and handles each connection on its own
+#thread, so the in-process micro-batcher still merges requests coming from different API workers.
+
+logger = logging.getLogger(__name__)
+
+def send_arrays(conn, header, arrays):
+  arrays = [np.ascontiguousarray(a) for a in arrays]
+  conn.send(dict(header, shapes=[a.shape for a in arrays], dtypes=[a.dtype.str for a in arrays]))
+  for a in arrays:
+    conn.send_bytes(a)
+
+def recv_arrays(conn):
+  header = conn.recv()
+  if "error" in header:
+    raise RuntimeError(f"Inference server error: {header['error']}")
+  arrays = [np.frombuffer(conn.recv_bytes(), dtype=np.dtype(dtype)).reshape(shape)
+            for shape, dtype in zip(header["shapes"], header["dtypes"])]
+  return header, arrays
+
+def remote_logits(address, model_name, arrays):
+  with Client(address) as conn:
+    send_arrays(conn, {"model": model_name}, [np.asarray(a, dtype=np.float32) for a in arrays])
+    _, logits = recv_arrays(conn)
+  return logits
+
+def handle_connection(conn):
+  import phoneme
+  with conn:
+    try:
+      header, arrays = recv_arrays(conn)
+      if header["model"] == "word":
+        with phoneme._loadLock:
+          phoneme.loadWordModel()
+      logits = phoneme.runModel(header["model"], arrays)
+      send_arrays(conn, {}, logits)
+    except EOFError:
+      pass
+    except Exception as e:
+      logger.exception("inference request failed")
+      try:
+        conn.send({"error": str(e)})
+      except OSError:
+        pass
+
+def worker_main(listener, threads):
+  import phoneme
+  if "torch" in sys.modules:
+    sys.modules["torch"].set_num_threads(threads)
+  phoneme.loadModels()
+  logger.info("inference worker %d ready", os.getpid())
+  while True:
+    conn = listener.accept()
+    threading.Thread(target=handle_connection, args=(conn,), daemon=True).start()
+
+def serve(address, workers):
+  from config import PRELOAD_MODELS
+  if PRELOAD_MODELS:
+    #load once here so the forked workers inherit the models instead of each reading the weights,
+    #with mmapped weights (see backends.share_weights) the weight pages stay shared between them
+    import phoneme
+    phoneme.loadModels()
+  if os.path.exists(address):
+    os.unlink(address)
+  listener = Listener(address, family="AF_UNIX", backlog=128)
+  #split the cores between the workers instead of letting every worker grab all of them
+  threads = max(1, (os.cpu_count() or 1) // workers)
+  context = multiprocessing.get_context("fork")
+  processes = [context.Process(target=worker_main, args=(listener, threads), name=f"inference-{i}")
+               for i in range(workers)]
+  for process in processes:
+    process.start()
+  logger.info("inference server listening on %s with %d workers", address, workers)
+  try:
+    for process in processes:
+      process.join()
+  except KeyboardInterrupt:
+    for process in processes:
+      process.terminate()
+  finally:
+    listener.close()
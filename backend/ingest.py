@@ -0,0 +1,98 @@
+import io
+import logging
+import struct
+import threading
+import time
+import numpy as np
+
+#Turns an uploaded recording into 16 kHz mono float32 for the scoring pipeline. The header is sniffed
+#first: a 16 kHz mono WAV is read straight out of the upload's bytes (float32 without any copy, 16-bit
+#PCM with one scaling pass), anything else soundfile can read is decoded and resampled with soxr
+#(scipy's polyphase resampler when soxr is missing), and what soundfile can not read (webm, m4a)
+#still goes through librosa.load.
+
+logger = logging.getLogger(__name__)
+
+WAVE_FORMAT_PCM = 1
+WAVE_FORMAT_IEEE_FLOAT = 3
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+
+_stats_lock = threading.Lock()
+_stats = {}
+
+#returns (format, channels, sample_rate, bits, data_offset, data_size), or None when it is not a WAV file
+def parse_wav_header(data):
+  if len(data) < 12 or data[:4] != b"RIFF" or data[8:12] != b"WAVE":
+    return None
+  fmt = None
+  position = 12
+  while position + 8 <= len(data):
+    chunk_id = data[position:position + 4]
+    chunk_size = struct.unpack_from("<I", data, position + 4)[0]
+    body = position + 8
+    if chunk_id == b"fmt " and chunk_size >= 16:
+      audio_format, channels, sample_rate, _, _, bits = struct.unpack_from("<HHIIHH", data, body)
+      if audio_format == WAVE_FORMAT_EXTENSIBLE and chunk_size >= 40:
+        #the real format code is the start of the subformat GUID
+        audio_format = struct.unpack_from("<H", data, body + 24)[0]
+      fmt = (audio_format, channels, sample_rate, bits)
+    elif chunk_id == b"data":
+      if fmt is None:
+        return None
+      #streamed WAVs often leave the data size at 0 or 0xFFFFFFFF
+      size = len(data) - body if chunk_size == 0 or body + chunk_size > len(data) else chunk_size
+      return fmt + (body, size)
+    position = body + chunk_size + (chunk_size & 1)
+  return None
+
+def resample(y, source_rate, target_rate):
+  try:
+    import soxr
+  except ImportError:
+    from math import gcd
+    from scipy.signal import resample_poly
+    divisor = gcd(source_rate, target_rate)
+    return resample_poly(y, target_rate // divisor, source_rate // divisor).astype(np.float32), "resample_poly"
+  return soxr.resample(y, source_rate, target_rate, quality="HQ").astype(np.float32, copy=False), "soxr"
+
+def decode(data, target_rate):
+  header = parse_wav_header(data)
+  if header:
+    audio_format, channels, sample_rate, bits, offset, size = header
+    if channels == 1 and sample_rate == target_rate:
+      if audio_format == WAVE_FORMAT_IEEE_FLOAT and bits == 32:
+        return np.frombuffer(data, dtype="<f4", count=size // 4, offset=offset), "wav-float32"
+      if audio_format == WAVE_FORMAT_PCM and bits == 16:
+        samples = np.frombuffer(data, dtype="<i2", count=size // 2, offset=offset)
+        return samples.astype(np.float32) * np.float32(1 / 32768), "wav-pcm16"
+  import soundfile
+  try:
+    y, sample_rate = soundfile.read(io.BytesIO(data), dtype="float32", always_2d=True)
+  except soundfile.LibsndfileError:
+    import librosa
+    y, _ = librosa.load(io.BytesIO(data), sr=target_rate)
+    return y, "librosa"
+  y = y.mean(axis=1) if y.shape[1] > 1 else y[:, 0]
+  if sample_rate == target_rate:
+    return y, "soundfile"
+  y, resampler = resample(y, sample_rate, target_rate)
+  return y, f"soundfile+{resampler}"
+
+#reads an upload (any file-like object) as 16 kHz mono float32, returns (samples, info) where info
+#has the route taken and the decode time
+def load_audio(audio_file, target_rate=16000):
+  start = time.perf_counter()
+  audio_file.seek(0)
+  data = audio_file.read()
+  y, route = decode(data, target_rate)
+  decode_ms = (time.perf_counter() - start) * 1000
+  logger.info("ingest route=%s bytes=%d seconds=%.2f decode=%.1f ms", route, len(data), len(y) / target_rate, decode_ms)
+  with _stats_lock:
+    stats = _stats.setdefault(route, {"requests": 0, "decode_ms": 0.0})
+    stats["requests"] += 1
+    stats["decode_ms"] += decode_ms
+  return y, {"route": route, "decode_ms": decode_ms}
+
+def ingest_stats():
+  with _stats_lock:
+    return {route: {"requests": s["requests"], "mean_decode_ms": s["decode_ms"] / s["requests"]} for route, s in _stats.items()}
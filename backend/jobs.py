@@ -0,0 +1,253 @@
+import asyncio
+import json
+import logging
+import os
+import socket
+import uuid
+from datetime import datetime, timedelta
+import pytz
+from fastapi import HTTPException
+from sqlalchemy import and_, func, or_
+import models
+from database import SessionLocal
+from executors import run_io
+from config import JOB_POLL_SECONDS, JOB_LEASE_SECONDS, JOB_MAX_ATTEMPTS, DUPLICATE_WINDOW_SECONDS
+
+#Submission jobs. The POST validates the submission, saves both uploads in a scoring_jobs row and
+#returns the job id. Workers (work() below, in the API processes when JOB_WORKER_IN_API is on and in
+#"python cli.py worker" on any other box) claim queued rows with SELECT ... FOR UPDATE SKIP LOCKED, so
+#any number of them can share the table without taking the same job. A claimed job is leased to its
+#worker for JOB_LEASE_SECONDS and the lease is renewed while it runs, a job whose worker died is
+#claimed again once the lease runs out. Server errors are retried up to JOB_MAX_ATTEMPTS attempts,
+#client errors fail the job right away and a full scoring queue (503) puts the job back as it was.
+#The result is saved to the history tables by the handler and copied to the row, where
+#GET /submissions/jobs/{id} and the event stream read it.
+
+logger = logging.getLogger(__name__)
+
+_wake = None
+_worker = None
+
+def now():
+  return datetime.now(pytz.timezone("Asia/Manila"))
+
+def create_job(db, kind, student_id, params, audio, storage_audio, audio_hash=None, idempotency_key=None):
+  job = models.ScoringJob(
+    job_id = uuid.uuid4().hex,
+    kind = kind,
+    student_id = student_id,
+    params = params,
+    status = "queued",
+    attempts = 0,
+    audio = audio,
+    storage_audio = storage_audio,
+    audio_hash = audio_hash,
+    idempotency_key = idempotency_key,
+    created_at = now(),
+    updated_at = now(),
+  )
+  db.add(job)
+  db.commit()
+  return job.job_id
+
+#a queued, running or finished job of the student with the same params (the assessment or practice
+#word) for the same upload or idempotency key, so a repeated POST gets the job it already has instead
+#of a second one
+def find_job(db, kind, student_id, params, audio_hash, idempotency_key=None):
+  since = now() - timedelta(seconds=DUPLICATE_WINDOW_SECONDS)
+  matches = [models.ScoringJob.audio_hash == audio_hash]
+  if idempotency_key:
+    matches.append(models.ScoringJob.idempotency_key == idempotency_key)
+  return db.query(models.ScoringJob.job_id).filter(
+    models.ScoringJob.kind == kind,
+    models.ScoringJob.student_id == student_id,
+    models.ScoringJob.status != "failed",
+    models.ScoringJob.created_at >= since,
+    *[models.ScoringJob.params[key].as_integer() == value for key, value in params.items()],
+    or_(*matches),
+  ).order_by(models.ScoringJob.created_at.desc()).limit(1).scalar()
+
+def job_status(job_id):
+  with SessionLocal() as db:
+    job = db.query(models.ScoringJob).filter(models.ScoringJob.job_id == job_id).first()
+    if not job:
+      return None
+    return {
+      "job_id": job.job_id,
+      "kind": job.kind,
+      "status": job.status,
+      "attempts": job.attempts,
+      "result": job.result,
+      "error": job.error,
+      "error_code": job.error_code,
+      "created_at": job.created_at.isoformat() if job.created_at else None,
+      "updated_at": job.updated_at.isoformat() if job.updated_at else None,
+    }
+
+#number of jobs in each status
+def job_counts():
+  with SessionLocal() as db:
+    return dict(db.query(models.ScoringJob.status, func.count()).group_by(models.ScoringJob.status).all())
+
+#the oldest job that is queued or whose lease ran out, leased to worker. Rows another worker is
+#claiming at the same moment are skipped instead of waited on.
+def claim_job(db, worker):
+  while True:
+    job = db.query(models.ScoringJob).filter(or_(
+      models.ScoringJob.status == "queued",
+      and_(models.ScoringJob.status == "running", models.ScoringJob.lease_expires_at < now()),
+    )).order_by(models.ScoringJob.created_at).with_for_update(skip_locked=True).first()
+    if job is None:
+      db.commit()
+      return None
+    if (job.attempts or 0) >= JOB_MAX_ATTEMPTS:
+      #the worker of its last attempt died with it
+      job.status = "failed"
+      job.error = f"Scoring did not finish after {job.attempts} attempts"
+      job.error_code = 500
+      job.audio = job.storage_audio = None
+      job.updated_at = now()
+      db.commit()
+      continue
+    job.status = "running"
+    job.attempts = (job.attempts or 0) + 1
+    job.worker = worker
+    job.lease_expires_at = now() + timedelta(seconds=JOB_LEASE_SECONDS)
+    job.updated_at = now()
+    db.commit()
+    #loaded here, in the io thread, so reading it later does not query from the event loop
+    db.refresh(job)
+    return job
+
+def renew_lease(job_id, worker):
+  with SessionLocal() as db:
+    db.query(models.ScoringJob).filter(
+      models.ScoringJob.job_id == job_id, models.ScoringJob.worker == worker, models.ScoringJob.status == "running",
+    ).update({"lease_expires_at": now() + timedelta(seconds=JOB_LEASE_SECONDS)})
+    db.commit()
+
+#only while worker still holds the job, a worker that lost its lease must not overwrite the new attempt
+def finish_job(db, job_id, worker, **fields):
+  db.rollback()
+  updated = db.query(models.ScoringJob).filter(
+    models.ScoringJob.job_id == job_id, models.ScoringJob.worker == worker, models.ScoringJob.status == "running",
+  ).update(dict(fields, updated_at=now()))
+  db.commit()
+  return updated
+
+async def keep_leased(job_id, worker):
+  while True:
+    await asyncio.sleep(JOB_LEASE_SECONDS / 3)
+    try:
+      await run_io(renew_lease, job_id, worker)
+    except Exception:
+      logger.warning("could not renew the lease of scoring job %s", job_id, exc_info=True)
+
+#handler(db, job) does the scoring and saving and returns the response the synchronous endpoint gives
+async def run_claimed(db, job, handler, worker):
+  job_id, attempts = job.job_id, job.attempts
+  renewing = asyncio.get_running_loop().create_task(keep_leased(job_id, worker))
+  try:
+    result = await handler(db, job)
+  except Exception as e:
+    code = e.status_code if isinstance(e, HTTPException) else 500
+    detail = str(e.detail) if isinstance(e, HTTPException) else str(e)
+    if code == 503:
+      #the scoring queue is full (executors.scoring_slot), queued again after a pause without using up an attempt
+      await asyncio.sleep(JOB_POLL_SECONDS)
+      fields = {"status": "queued", "attempts": attempts - 1, "lease_expires_at": None}
+    elif code >= 500 and attempts < JOB_MAX_ATTEMPTS:
+      logger.warning("scoring job %s attempt %d failed, queued again: %s", job_id, attempts, detail)
+      fields = {"status": "queued", "error": detail, "error_code": code, "lease_expires_at": None}
+    else:
+      if code >= 500:
+        logger.exception("scoring job %s failed", job_id)
+      fields = {"status": "failed", "error": detail, "error_code": code, "audio": None, "storage_audio": None}
+  else:
+    #the audio is in the history row's storage now
+    fields = {"status": "done", "result": result, "error": None, "error_code": None, "audio": None, "storage_audio": None}
+  finally:
+    renewing.cancel()
+  if not await run_io(finish_job, db, job_id, worker, **fields):
+    logger.warning("scoring job %s was taken over by another worker, result dropped", job_id)
+
+#lets the local workers pick up a job that was just queued without waiting for their next poll
+def wake_workers():
+  if _wake is not None:
+    _wake.set()
+
+#runs work() in this process once. The API processes start it with the app when READSPEAK_SUBMISSION_JOBS
+#is on, otherwise when the first ?job=true submission is queued, so they do not poll an unused table.
+def start_worker(handlers, concurrency):
+  global _worker
+  if _worker is None:
+    _worker = asyncio.get_running_loop().create_task(work(handlers, concurrency))
+  return _worker
+
+#claims and runs jobs forever, at most concurrency at a time. handlers maps a job kind to its handler.
+async def work(handlers, concurrency, worker=None):
+  global _wake
+  worker = worker or f"{socket.gethostname()}:{os.getpid()}"
+  _wake = asyncio.Event()
+  slots = asyncio.Semaphore(concurrency)
+  running = set()
+  logger.info("scoring worker %s running %d jobs at a time", worker, concurrency)
+
+  async def run(db, job):
+    try:
+      await run_claimed(db, job, handlers[job.kind], worker)
+    finally:
+      await run_io(db.close)
+      slots.release()
+
+  while True:
+    await slots.acquire()
+    _wake.clear()
+    db = SessionLocal()
+    try:
+      job = await run_io(claim_job, db, worker)
+    except Exception:
+      logger.exception("could not claim a scoring job")
+      job = None
+    if job is None:
+      await run_io(db.close)
+      slots.release()
+      try:
+        await asyncio.wait_for(_wake.wait(), JOB_POLL_SECONDS)
+      except asyncio.TimeoutError:
+        pass
+      continue
+    task = asyncio.get_running_loop().create_task(run(db, job))
+    #keep a reference until it finishes, the event loop only holds a weak one
+    running.add(task)
+    task.add_done_callback(running.discard)
+
+def job_urls(job_id):
+  return {
+    "job_id": job_id,
+    "status": "queued",
+    "status_url": f"/submissions/jobs/{job_id}",
+    "events_url": f"/submissions/jobs/{job_id}/events",
+  }
+
+#server-sent events: one event (named after the status) every time the status changes, ends when the
+#job is done or failed. Comment lines keep idle connections from being closed by proxies.
+async def job_events(job_id):
+  last = None
+  waited = 0.0
+  while True:
+    status = await run_io(job_status, job_id)
+    if status is None:
+      yield f"event: error\ndata: {json.dumps({'detail': 'Job not found'})}\n\n"
+      return
+    if status["status"] != last:
+      last = status["status"]
+      waited = 0.0
+      yield f"event: {last}\ndata: {json.dumps(status)}\n\n"
+    if last in ("done", "failed"):
+      return
+    await asyncio.sleep(JOB_POLL_SECONDS)
+    waited += JOB_POLL_SECONDS
+    if waited >= 15:
+      waited = 0.0
+      yield ": keep-alive\n\n"
@@ -0,0 +1,96 @@
+import logging
+import threading
+from collections import OrderedDict
+from config import LEXICON_CACHE_SIZE, LEXICON_DB
+
+#Word -> (phonemes, raw phonemes) cache in front of the gruut conversion in textToPhoneme.
+#Text is looked up one whitespace separated token at a time: first in an in-process LRU, then in the
+#lexicon table shared by every worker, and only the tokens found in neither go through gruut (and are
+#written back to the table).
+
+logger = logging.getLogger(__name__)
+
+#bump when the gruut version or the phoneme cleanup in phoneme.gruutPhonemes changes, older rows are
+#then ignored and converted again
+G2P_VERSION = "1"
+
+class Lexicon:
+  def __init__(self, convert, size=LEXICON_CACHE_SIZE, persist=LEXICON_DB):
+    self.convert = convert
+    self.size = size
+    self.persist = persist
+    self._entries = OrderedDict()
+    self._lock = threading.Lock()
+    self._counts = {"tokens": 0, "memory_hits": 0, "db_hits": 0, "converted": 0}
+
+  #returns a (phonemes, raw_phonemes) pair of tuples for every token, in order
+  def lookup(self, words):
+    found = {}
+    with self._lock:
+      for word in set(words):
+        entry = self._entries.get(word)
+        if entry is not None:
+          self._entries.move_to_end(word)
+          found[word] = entry
+    missing = [word for word in dict.fromkeys(words) if word not in found]
+    stored = self.load(missing) if missing and self.persist else {}
+    converted = {word: self.convert(word) for word in missing if word not in stored}
+    if converted and self.persist:
+      self.store(converted)
+    with self._lock:
+      for word, entry in list(stored.items()) + list(converted.items()):
+        self._entries[word] = entry
+      while len(self._entries) > self.size:
+        self._entries.popitem(last=False)
+      #a token repeated in the same text only counts as a miss the first time
+      seen = set()
+      for word in words:
+        if word in found or word in seen:
+          self._counts["memory_hits"] += 1
+        elif word in stored:
+          self._counts["db_hits"] += 1
+        else:
+          self._counts["converted"] += 1
+        seen.add(word)
+      self._counts["tokens"] += len(words)
+    return [found.get(word) or stored.get(word) or converted[word] for word in words]
+
+  def load(self, words):
+    import models
+    from database import SessionLocal
+    from sqlalchemy.exc import SQLAlchemyError
+    try:
+      with SessionLocal() as db:
+        rows = db.query(models.Lexicon).filter(models.Lexicon.word.in_(words), models.Lexicon.g2p_version == G2P_VERSION).all()
+    except SQLAlchemyError:
+      logger.warning("lexicon table lookup failed, converting with gruut", exc_info=True)
+      return {}
+    return {row.word: (tuple(row.phonemes), tuple(row.raw_phonemes)) for row in rows}
+
+  def store(self, entries):
+    import models
+    from database import SessionLocal
+    from sqlalchemy.dialects.postgresql import insert
+    from sqlalchemy.exc import SQLAlchemyError
+    rows = [{"word": word, "phonemes": list(phonemes), "raw_phonemes": list(raw_phonemes), "g2p_version": G2P_VERSION}
+            for word, (phonemes, raw_phonemes) in entries.items()]
+    statement = insert(models.Lexicon).values(rows)
+    #another worker may have converted the same word meanwhile
+    statement = statement.on_conflict_do_update(index_elements=[models.Lexicon.word], set_={
+      "phonemes": statement.excluded.phonemes,
+      "raw_phonemes": statement.excluded.raw_phonemes,
+      "g2p_version": statement.excluded.g2p_version,
+    })
+    try:
+      with SessionLocal() as db:
+        db.execute(statement)
+        db.commit()
+    except SQLAlchemyError:
+      logger.warning("could not save %d words to the lexicon table", len(rows), exc_info=True)
+
+  def stats(self):
+    with self._lock:
+      stats = dict(self._counts, entries=len(self._entries))
+    hits = stats["memory_hits"] + stats["db_hits"]
+    stats["hit_ratio"] = hits / stats["tokens"] if stats["tokens"] else None
+    return stats
@@ -1,10 +1,20 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from starlette.responses import JSONResponse
+import threading
 from database import engine
 import models
 import cloudinary
 import cloudinary.uploader
 from routers import assessmentRoutes, stagesRoutes, submissionRoutes, userRoutes, statRoutes
+from phoneme import inferenceStats, lexicon, loadModels, modelState, modelsReady
+from config import PRELOAD_MODELS, JOB_WORKER_IN_API, SUBMISSION_JOBS, SCORING_WORKERS
+from pipeline import selection_stats
+from ingest import ingest_stats
+from jobs import start_worker, job_counts
+from storage import flush_spool_forever
+from executors import run_io
+import asyncio
 
 #API Stuff
 app = FastAPI()
@@ -44,6 +54,57 @@ app.include_router(statRoutes.router)
 async def root():
   return{"detail" : "API is running."}
 
+#models load in the background so the non-scoring routes are served right away,
+#scoring requests that arrive before they are ready wait for the load to finish
+@app.on_event("startup")
+async def preload_models():
+  if PRELOAD_MODELS:
+    threading.Thread(target=loadModels, name="model-loader", daemon=True).start()
+
+#scores the queued submission jobs when every submission is a job (READSPEAK_SUBMISSION_JOBS), with it
+#off the worker starts on the first ?job=true submission instead, see jobs.start_worker
+@app.on_event("startup")
+async def start_job_worker():
+  if JOB_WORKER_IN_API and SUBMISSION_JOBS:
+    start_worker(submissionRoutes.JOB_HANDLERS, SCORING_WORKERS)
+
+#uploads the recordings whose upload failed during their submission, see storage.py
+spool_flusher = None
+@app.on_event("startup")
+async def start_spool_flusher():
+  global spool_flusher
+  spool_flusher = asyncio.get_running_loop().create_task(flush_spool_forever())
+
+#used by the load balancer, only route scoring traffic here once this returns 200
+@app.get("/health/ready")
+async def ready():
+  return JSONResponse(modelState, status_code=200 if modelsReady() else 503)
+
+#batch size and queue wait of the inference micro-batchers
+@app.get("/metrics/inference")
+async def inference_metrics():
+  return inferenceStats()
+
+#in shadow mode, how often the adaptive denoise-variant pick matched the best of all three
+@app.get("/metrics/variants")
+async def variant_metrics():
+  return selection_stats()
+
+#requests and mean decode time per ingest route (wav-float32, wav-pcm16, soundfile+soxr, ...)
+@app.get("/metrics/ingest")
+async def ingest_metrics():
+  return ingest_stats()
+
+#submission jobs in each status (queued, running, done, failed)
+@app.get("/metrics/jobs")
+async def job_metrics():
+  return await run_io(job_counts)
+
+#hit ratio of the grapheme to phoneme cache
+@app.get("/metrics/lexicon")
+async def lexicon_metrics():
+  return lexicon.stats()
+
 if __name__ == "__main__":
   import uvicorn
   
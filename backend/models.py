@@ -1,4 +1,4 @@
-from sqlalchemy import Boolean, Column, ForeignKey, Integer, String, DateTime, Float, ARRAY, TIMESTAMP
+from sqlalchemy import Boolean, Column, ForeignKey, Integer, String, DateTime, Float, ARRAY, TIMESTAMP, JSON, LargeBinary
 from sqlalchemy.orm import relationship, backref
 try:
     from database import Base
@@ -52,6 +52,7 @@ class PronunciationAssessment(Base):
     assessment_type = Column(Integer, ForeignKey("pronunciation_assessment_types.type_id"), nullable=True)
     audio_url = Column(String, index=True, nullable=True)
     audio_public_id = Column(String, index=True, nullable=True)
+    word_index = Column(JSON, nullable=True) #added column, see phoneme.wordIndex
     
 
 class PronunciationAssessmentType(Base):
@@ -115,6 +116,10 @@ class PracticeWordSubmissionHistory(Base):
     audio_public_id = Column(String, index=True)
     raw_phoneme_output = Column(ARRAY(String), index=True)
     duration = Column(Float, index=True)
+    audio_hash = Column(String, index=True, nullable=True) #added column, see duplicates.py
+    idempotency_key = Column(String, index=True, nullable=True) #added column
+    archive_original_bytes = Column(Integer, nullable=True) #added column, see archive.py
+    archive_bytes = Column(Integer, index=True, nullable=True) #added column
     
 class AssessmentHistory(Base):
     __tablename__ = 'phoneme_assessment_history'
@@ -130,6 +135,10 @@ class AssessmentHistory(Base):
     audio_public_id = Column(String, index=True)
     stage_id = Column(Integer, ForeignKey("stages.stage_id", ondelete="CASCADE"), nullable=True)
     duration = Column(Float, index=True)
+    audio_hash = Column(String, index=True, nullable=True) #added column, see duplicates.py
+    idempotency_key = Column(String, index=True, nullable=True) #added column
+    archive_original_bytes = Column(Integer, nullable=True) #added column, see archive.py
+    archive_bytes = Column(Integer, index=True, nullable=True) #added column
     assessment = relationship("PronunciationAssessment", backref="assessment_histories")
 
 class ComprehensionAssessmentHistory(Base):
@@ -148,3 +157,32 @@ class ExpiredTokens(Base):
     
     token_id = Column(Integer, primary_key = True, index = True)
     token_string = Column(String, index=True)
+
+class Lexicon(Base):
+    __tablename__ = 'lexicon'
+    
+    word = Column(String, primary_key = True, index = True)
+    phonemes = Column(ARRAY(String, dimensions=1))
+    raw_phonemes = Column(ARRAY(String, dimensions=1))
+    g2p_version = Column(String, index = True)
+
+#submissions scored in the background, see jobs.py
+class ScoringJob(Base):
+    __tablename__ = 'scoring_jobs'
+    job_id = Column(String, primary_key = True, index = True)
+    kind = Column(String, index = True)
+    student_id = Column(Integer, ForeignKey("users.user_id", ondelete="CASCADE"), index = True)
+    params = Column(JSON)
+    status = Column(String, index = True)
+    attempts = Column(Integer, default = 0) #added column
+    worker = Column(String, nullable = True) #added column
+    lease_expires_at = Column(TIMESTAMP(timezone=True), index = True, nullable = True) #added column
+    result = Column(JSON, nullable = True)
+    error = Column(String, nullable = True)
+    error_code = Column(Integer, nullable = True)
+    audio = Column(LargeBinary, nullable = True)
+    storage_audio = Column(LargeBinary, nullable = True)
+    audio_hash = Column(String, index = True, nullable = True)
+    idempotency_key = Column(String, index = True, nullable = True)
+    created_at = Column(TIMESTAMP(timezone=True), index = True)
+    updated_at = Column(TIMESTAMP(timezone=True))
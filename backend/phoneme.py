@@ -1,24 +1,133 @@
-from transformers import Wav2Vec2Processor, Wav2Vec2ForCTC
-from transformers import AutoProcessor, AutoModelForCTC
-# from datasets import load_dataset
-from gruut import sentences
+import re
+import threading
+import time
 import numpy
-import torch
-import librosa
+from scipy.special import log_softmax
+from batching import MicroBatcher
+from config import INFERENCE_BATCHING, BATCH_MAX_SIZE, BATCH_MAX_WAIT_MS, WORD_OFFSET_MODE, INFERENCE_BACKEND
+from config import PHONEME_CHECKPOINT, WORD_CHECKPOINT, INFERENCE_MODE, INFERENCE_ADDRESS
+from config import POSTERIOR_CACHE, POSTERIOR_CACHE_DIR, POSTERIOR_CACHE_BYTES
+from alignment import align_word_offsets
+from backends import load_backend, model_source
+from lexicon import Lexicon
+from posteriors import PosteriorStore, cached_posteriors
 
 #AI model stuff
-# load model and processor for phonemes
-# processor = Wav2Vec2Processor.from_pretrained("./model")
-# model = Wav2Vec2ForCTC.from_pretrained("./model")
-processor = Wav2Vec2Processor.from_pretrained("facebook/wav2vec2-lv-60-espeak-cv-ft")
-model = Wav2Vec2ForCTC.from_pretrained("facebook/wav2vec2-lv-60-espeak-cv-ft")
-
-# # load model and processor for words
-# processor2 = AutoProcessor.from_pretrained("./model2")
-# model2 = AutoModelForCTC.from_pretrained("./model2")
-processor2 = AutoProcessor.from_pretrained("facebook/wav2vec2-large-960h-lv60-self")
-model2 = AutoModelForCTC.from_pretrained("facebook/wav2vec2-large-960h-lv60-self")
-sr = processor.feature_extractor.sampling_rate
+#the models are loaded by loadModels (in the background at API startup, see main.py) instead of
+#at import time, so the non-scoring routes are up before the weights are.
+#model and model2 are inference backends (see backends.py), picked with READSPEAK_INFERENCE_BACKEND.
+#with READSPEAK_INFERENCE_MODE=remote they stay None, only the processors are loaded here and the
+#forward passes are sent to the inference server (see inference_server.py)
+processor = None
+model = None
+#only needed when word offsets come from the word model instead of forced alignment
+processor2 = None
+model2 = None
+#sampling rate the wav2vec2 feature extractors expect
+sr = 16000
+
+modelState = {"status": "not_loaded", "error": None, "load_seconds": None}
+_loadLock = threading.Lock()
+
+def loadModels():
+  global processor, model
+  with _loadLock:
+    if modelState["status"] == "ready":
+      return
+    modelState["status"] = "loading"
+    modelState["error"] = None
+    start = time.perf_counter()
+    try:
+      from transformers import Wav2Vec2Processor, Wav2Vec2ForCTC
+      # load model and processor for phonemes
+      # processor = Wav2Vec2Processor.from_pretrained("./model")
+      # model = Wav2Vec2ForCTC.from_pretrained("./model")
+      processor = Wav2Vec2Processor.from_pretrained(model_source(PHONEME_CHECKPOINT))
+      if INFERENCE_MODE == "local":
+        model = load_backend(INFERENCE_BACKEND, PHONEME_CHECKPOINT, Wav2Vec2ForCTC)
+      if WORD_OFFSET_MODE == "model":
+        loadWordModel()
+    except Exception as e:
+      modelState["status"] = "failed"
+      modelState["error"] = str(e)
+      raise
+    modelState["status"] = "ready"
+    modelState["load_seconds"] = round(time.perf_counter() - start, 2)
+
+def loadWordModel():
+  global processor2, model2
+  if processor2 is not None:
+    return
+  from transformers import AutoProcessor, AutoModelForCTC
+  # # load model and processor for words
+  # processor2 = AutoProcessor.from_pretrained("./model2")
+  # model2 = AutoModelForCTC.from_pretrained("./model2")
+  if INFERENCE_MODE == "local":
+    model2 = load_backend(INFERENCE_BACKEND, WORD_CHECKPOINT, AutoModelForCTC)
+  processor2 = AutoProcessor.from_pretrained(model_source(WORD_CHECKPOINT))
+
+def ensureModels():
+  if modelState["status"] != "ready":
+    loadModels()
+
+def modelsReady():
+  return modelState["status"] == "ready"
+
+#feature extraction for a 1-D clip at sr, returns NumPy input_values
+def prepareInputs(audio):
+  ensureModels()
+  return processor(audio, sampling_rate=sr, return_tensors="np", padding=True)
+
+#pads a list of 1-D input_values into one (batch, time) array and runs a single forward pass,
+#returning each clip's own logits with the padded frames cut off
+def forwardBatch(ctcModel, arrays):
+  lengths = [len(a) for a in arrays]
+  input_values = numpy.zeros((len(arrays), max(lengths)), dtype=numpy.float32)
+  attention_mask = numpy.zeros((len(arrays), max(lengths)), dtype=numpy.int64)
+  for i, a in enumerate(arrays):
+    input_values[i, :lengths[i]] = a
+    attention_mask[i, :lengths[i]] = 1
+  logits = ctcModel.forward(input_values, attention_mask)
+  frames = ctcModel.output_lengths(lengths)
+  return [logits[i, :frames[i]] for i in range(len(arrays))]
+
+phonemeBatcher = MicroBatcher(lambda arrays: forwardBatch(model, arrays), BATCH_MAX_SIZE, BATCH_MAX_WAIT_MS, "phoneme-batcher")
+wordBatcher = MicroBatcher(lambda arrays: forwardBatch(model2, arrays), BATCH_MAX_SIZE, BATCH_MAX_WAIT_MS, "word-batcher")
+
+#logits for a list of 1-D input_values from the "phoneme" or "word" model, wherever it runs
+def runModel(name, arrays):
+  if INFERENCE_MODE == "remote":
+    from inference_server import remote_logits
+    return remote_logits(INFERENCE_ADDRESS, name, arrays)
+  ctcModel, batcher = (model, phonemeBatcher) if name == "phoneme" else (model2, wordBatcher)
+  if INFERENCE_BATCHING:
+    return [future.result() for future in batcher.submit_many(arrays)]
+  return forwardBatch(ctcModel, arrays)
+
+#checkpoint and backend the logits come from, part of the posterior cache key
+def modelVersion(name):
+  return f"{PHONEME_CHECKPOINT if name == 'phoneme' else WORD_CHECKPOINT}:{INFERENCE_BACKEND}"
+
+posteriorStore = PosteriorStore(POSTERIOR_CACHE_DIR, POSTERIOR_CACHE_BYTES) if POSTERIOR_CACHE else None
+
+#runModel for the scoring pipeline. Phoneme model outputs go through the posterior cache when the
+#caller names their source, cacheSources holds (audio_digest of the decoded recording, preprocessing)
+#for each array (see pipeline.cache_source)
+def scoreModel(name, arrays, cacheSources=None):
+  if name == "phoneme" and posteriorStore and cacheSources:
+    keys = [posteriorStore.key(digest, preprocessing, modelVersion(name)) for digest, preprocessing in cacheSources]
+    return cached_posteriors(posteriorStore, keys, arrays, lambda missing: runModel(name, missing))
+  return runModel(name, arrays)
+
+def modelLogits(inputs, name, cacheSource=None):
+  values = numpy.asarray(inputs["input_values"][0], dtype=numpy.float32)
+  return scoreModel(name, [values], [cacheSource] if cacheSource else None)[0]
+
+def inferenceStats():
+  stats = {"phoneme": phonemeBatcher.stats(), "word": wordBatcher.stats()}
+  if posteriorStore:
+    stats["posterior_cache"] = posteriorStore.stats()
+  return stats
 
 #todo
 #Compare phoneme offset with word offset to group phonemes into words(could use some more improvements)
@@ -28,18 +137,69 @@ sr = processor.feature_extractor.sampling_rate
 #error handling if some words were not detected, eg. wood would a woodchuck, 'a' was not detected
 #maybe compare words detected first before phonemes?
 #problem: some starting phonemes get included in the previous word
-def wordOffsetGet(inputs):
+#in forced mode the reference phonemes are aligned against the phoneme logits of the same clip,
+#otherwise the word model is run on the inputs
+def wordOffsetGet(inputs, logits=None, raw_phonemes=None, word_phonemes=None):
+  if forcedWordOffsets(logits, raw_phonemes):
+    return alignWordOffsets(logits, raw_phonemes, word_phonemes)
   # retrieve logits
-  with torch.no_grad():
-    #logits = model(inputs).logits
-    logits = model2(inputs["input_values"]).logits
+  ensureModels()
+  with _loadLock:
+    loadWordModel()
+  logits = modelLogits(inputs, "word")
   # take argmax and decode
-  predicted_ids = torch.argmax(logits, dim=-1)
+  predicted_ids = numpy.argmax(logits, axis=-1)[None]
   transcription = processor2.batch_decode(predicted_ids, output_word_offsets = True)
   # print(transcription.word_offsets[0])
   return transcription.word_offsets[0]
 
+#whether wordOffsetGet aligns against these logits, the word offsets are then on the same frames as
+#the char offsets decoded from them
+def forcedWordOffsets(logits, raw_phonemes):
+  return WORD_OFFSET_MODE == "forced" and logits is not None and bool(raw_phonemes)
+
+def alignWordOffsets(logits, raw_phonemes, word_phonemes):
+  ensureModels()
+  log_probs = log_softmax(logits.astype(numpy.float32), axis=-1)
+  return align_word_offsets(log_probs, raw_phonemes, word_phonemes, processor.tokenizer.get_vocab(), processor.tokenizer.pad_token_id)
+
+#served a word at a time from the lexicon cache (see lexicon.py), gruut only runs on misses
 def textToPhoneme(text):
+  output = []
+  output2 = []
+  for phones, phones2 in lexicon.lookup(text.split()):
+    output.extend(phones)
+    output2.extend(phones2)
+  return output, output2
+
+#the reference for each word of text.split(' ') as the submission loop walks it, saved with the
+#assessment so flagged words never need converting again: the word, the word with punctuation
+#stripped (what PracticeWords stores) and its phonemes. One lexicon lookup for every token of the text,
+#split back into the words.
+def wordIndex(text):
+  words = text.split(' ')
+  tokens = [word.split() for word in words]
+  entries = iter(lexicon.lookup([token for wordTokens in tokens for token in wordTokens]))
+  index = []
+  for word, wordTokens in zip(words, tokens):
+    phones, phones2 = [], []
+    for _ in wordTokens:
+      tokenPhones, tokenPhones2 = next(entries)
+      phones.extend(tokenPhones)
+      phones2.extend(tokenPhones2)
+    index.append({"word": word, "clean": cleanWord(word), "phonemes": phones, "raw_phonemes": phones2})
+  return index
+
+#the phonemes of the whole text from its wordIndex, what textToPhoneme(text) returns
+def indexPhonemes(index):
+  return [p for entry in index for p in entry["phonemes"]], [p for entry in index for p in entry["raw_phonemes"]]
+
+def cleanWord(word):
+  return re.sub(r"[^\w\s'-]", '', word)
+
+#converts with gruut, only called for the words lexicon has not seen yet
+def gruutPhonemes(text):
+  from gruut import sentences
   output = []
   output2 = []
   # using phonemizer
@@ -64,65 +224,60 @@ def textToPhoneme(text):
             phonemes = phonemes.replace("d͡ʒ", "dʒ")
             output2.append(phonemes)
   
-  return output, output2
+  return tuple(output), tuple(output2)
+
+lexicon = Lexicon(gruutPhonemes)
 
-def audioToPhoneme(inputs):
+def audioToPhoneme(inputs, cacheSource=None):
   # retrieve logits
-  with torch.no_grad():
-    # logits = model(inputs).logits
-    logits = model(inputs["input_values"]).logits
+  ensureModels()
+  logits = modelLogits(inputs, "phoneme", cacheSource)
+  return logitsToPhoneme(logits)
+
+def logitsToPhoneme(logits):
+  ensureModels()
   # take argmax and decode
-  predicted_ids = torch.argmax(logits, dim=-1)
+  predicted_ids = numpy.argmax(logits, axis=-1)[None]
   transcription = processor.batch_decode(predicted_ids, output_char_offsets = True)
-  transcriptionstr = ''.join(transcription.text)
-  transcriptionstr = transcriptionstr.replace("ː", " ")
-  transcriptionstr2 = transcriptionstr.split()
-  transcriptionstr = transcriptionstr.replace(" ", "")
+  transcriptionstr, transcriptionstr2 = splitPhonemes(''.join(transcription.text))
   # print(transcription.char_offsets[0])
   return transcriptionstr, transcription.char_offsets[0], transcriptionstr2
 
-def groupPhonemes(audio_phonemes,word_offsets, char_offsets):
-  #change it so that it iterates through chars in char_offsets, not in audio_phonemes
-  grouped_phonemes = []
-  current_word = []
-  word_index = 0
-  char_index = 0
-  next_word_index = 1
-  word_reset_offset = int(word_offsets[word_index]['start_offset'])
-  char_reset_offset = int(char_offsets[char_index]['start_offset'])
-  # print("Word length",len(word_offsets))
-  # for i, key in enumerate(char_offsets):
-  #   print(f"Index: {i}, Key: {key}, Char: {key['char']}")
-  while char_index < len(char_offsets) and word_index < len(word_offsets):
-      # print(char_offsets[char_index]['char'])
-      if next_word_index >= len(word_offsets) and char_index < len(char_offsets):
-        current_word.append(char_offsets[char_index]['char'].replace("ː",""))
-        # print(current_word)
-        char_index += 1
-      elif word_index < len(word_offsets) and char_index < len(char_offsets):
-        word_start = int(word_offsets[word_index]['start_offset']) - word_reset_offset
-        word_end = int(word_offsets[word_index]['end_offset']) - word_reset_offset
-        next_word_start = int(word_offsets[next_word_index]['start_offset']) - word_reset_offset
-        char_start = int(char_offsets[char_index]['start_offset']) - char_reset_offset
-        char_end = int(char_offsets[char_index]['end_offset']) - char_reset_offset
-        # print(char_start, ' ', word_end, ' ', next_word_start)
-        if char_start >= word_start and char_start < next_word_start:
-            current_word.append(char_offsets[char_index]['char'].replace("ː",""))
-            # print(current_word)
-            char_index += 1
-        elif char_index < len(char_offsets) and char_start >= word_end:
-            # print('bruh2')
-            if current_word:
-                grouped_phonemes.append(''.join(current_word))
-                current_word = []
-                word_index += 1
-                next_word_index += 1
-            else:
-              break
-  if current_word:
-      # print('bruh3')
-      grouped_phonemes.append(''.join(current_word))
-  # print(len(grouped_phonemes))
-  # print(grouped_phonemes)
-      
-  return grouped_phonemes
+#scores several versions of the same clip (eg. the denoise variants) with one forward pass
+#and one batch_decode, returns the audioToPhoneme tuple plus the logits for each input in order
+def audioToPhonemeVariants(inputsList, cacheSources=None):
+  ensureModels()
+  values = [numpy.asarray(inputs["input_values"][0], dtype=numpy.float32) for inputs in inputsList]
+  logits = scoreModel("phoneme", values, cacheSources)
+  predicted_ids = [numpy.argmax(l, axis=-1).tolist() for l in logits]
+  transcription = processor.batch_decode(predicted_ids, output_char_offsets = True)
+  results = []
+  for text, char_offsets, variantLogits in zip(transcription.text, transcription.char_offsets, logits):
+    transcriptionstr, transcriptionstr2 = splitPhonemes(text)
+    results.append((transcriptionstr, char_offsets, transcriptionstr2, variantLogits))
+  return results
+
+#the length mark is treated as a separator, returns the joined phonemes and the phoneme list
+def splitPhonemes(text):
+  transcriptionstr = text.replace("ː", " ")
+  transcriptionstr2 = transcriptionstr.split()
+  transcriptionstr = transcriptionstr.replace(" ", "")
+  return transcriptionstr, transcriptionstr2
+
+#each char goes to the last word starting at or before it, one string per word that got any chars.
+#Offsets from two models (the word model) are compared relative to the first word and the first char,
+#as the original loop did. With sameTimeBase (forced alignment, both from the same logits) the frames
+#are compared as they are, so a stray char before the first word does not shift every boundary, it
+#goes to the first word.
+def groupPhonemes(audio_phonemes, word_offsets, char_offsets, sameTimeBase=False):
+  if not word_offsets or not char_offsets:
+    return []
+  word_starts = numpy.array([int(offset['start_offset']) for offset in word_offsets], dtype=numpy.int64)
+  char_starts = numpy.array([int(offset['start_offset']) for offset in char_offsets], dtype=numpy.int64)
+  if sameTimeBase:
+    words = numpy.maximum(numpy.searchsorted(word_starts, char_starts, side="right") - 1, 0)
+  else:
+    words = numpy.searchsorted(word_starts - word_starts[0], char_starts - char_starts[0], side="right") - 1
+  boundaries = (numpy.flatnonzero(numpy.diff(words)) + 1).tolist()
+  chars = [offset['char'].replace("ː", "") for offset in char_offsets]
+  return [''.join(chars[begin:end]) for begin, end in zip([0] + boundaries, boundaries + [len(chars)])]
@@ -0,0 +1,141 @@
+import logging
+import threading
+import librosa
+from config import VARIANT_SELECTION, EARLY_EXIT, EARLY_EXIT_SCORE, VAD, VAD_MARGIN_DB, VAD_MIN_SNR_DB, VAD_PAD_MS, VAD_MAX_PAUSE_MS
+from denoise import Spectrogram, VARIANTS, VARIANT_ORDER, analyze, denoise, select_variants
+from ingest import load_audio
+from vad import trim_silence
+from posteriors import audio_digest
+from alignment import split_words
+from scoring import align, phoneme_error_rate
+from phoneme import wordOffsetGet, forcedWordOffsets, audioToPhoneme, audioToPhonemeVariants, groupPhonemes, prepareInputs, sr
+
+#CPU-heavy part of the submission endpoints (decode, denoise, inference, scoring).
+#These are plain blocking functions, the routes run them on the scoring executor.
+
+logger = logging.getLogger(__name__)
+
+#shadow mode counters, how often the adaptive pick contains a variant scoring as well as the best
+_selection_lock = threading.Lock()
+_selection = {"requests": 0, "matches": 0, "winners": {}, "chosen": {}}
+
+def record_selection(analysis, chosen, scores, best):
+  match = max(scores[name] for name in chosen) >= scores[best]
+  logger.info("variant selection snr=%.1f dB spread=%.1f dB chose=%s best=%s match=%s scores=%s",
+              analysis["snr_db"], analysis["noise_spread_db"], "+".join(chosen), best, match, scores)
+  with _selection_lock:
+    _selection["requests"] += 1
+    _selection["matches"] += match
+    _selection["winners"][best] = _selection["winners"].get(best, 0) + 1
+    key = "+".join(chosen)
+    _selection["chosen"][key] = _selection["chosen"].get(key, 0) + 1
+
+def selection_stats():
+  with _selection_lock:
+    stats = {"mode": VARIANT_SELECTION, "requests": _selection["requests"], "matches": _selection["matches"],
+             "winners": dict(_selection["winners"]), "chosen": dict(_selection["chosen"])}
+  stats["match_rate"] = stats["matches"] / stats["requests"] if stats["requests"] else None
+  return stats
+
+#cuts edge silence and long pauses when VAD is on, returns the audio for the model and the Trim that
+#maps its offsets back to the recording (None when nothing was cut)
+def trimmed(input_values):
+  trim = trim_silence(input_values, sr) if VAD else None
+  return cut(trim, input_values), trim
+
+def cut(trim, y):
+  return trim.apply(y) if trim else y
+
+#bump when a change to denoise.py or vad.py changes the model input made from the same recording
+PREPROCESSING_VERSION = 1
+
+#where a variant's model input comes from, for the posterior cache: the decoded recording and what
+#was done to it. A stored recording scored again with the same settings hits the cache.
+def cache_source(digest, name):
+  vad = f"vad:{VAD_MARGIN_DB}:{VAD_MIN_SNR_DB}:{VAD_PAD_MS}:{VAD_MAX_PAUSE_MS}" if VAD else "novad"
+  return digest, f"{PREPROCESSING_VERSION}:{name}:{vad}"
+
+#the reference phonemes of each word of text_content.split(' '), from the assessment's word_index when
+#it matches raw_phoneme_content, otherwise split along phoneme_content (which the old per word loop
+#also assumed lines up with the words of the text)
+def reference_words(text_phonemes, phoneme_content, word_phonemes=None):
+  if word_phonemes is not None and [p for word in word_phonemes for p in word] == list(text_phonemes):
+    return word_phonemes
+  return [list(text_phonemes[start:end]) for _, start, end in split_words(text_phonemes, phoneme_content or [])]
+
+#the SNR estimate and the denoisers' noise statistics come from the quiet frames, so they see the whole
+#recording: its spectrogram is analysed and denoised, and the denoised audio is trimmed like the raw one
+def score_phoneme_audio(audio_file, text_phonemes, phoneme_content, word_phonemes=None):
+  input_values, ingest = load_audio(audio_file, sr)
+  digest = audio_digest(input_values)
+  audio, trim = trimmed(input_values)
+  spec = None
+  if VARIANT_SELECTION == "all":
+    names = VARIANT_ORDER
+  else:
+    spec = Spectrogram(input_values, sr)
+    analysis = analyze(spec)
+    chosen = select_variants(analysis)
+    names = chosen if VARIANT_SELECTION == "adaptive" else VARIANT_ORDER
+  #with early exit the raw clip is scored on its own first, the denoised variants are only made and
+  #scored when it falls short of EARLY_EXIT_SCORE (shadow mode needs all three and never exits early)
+  stages = [list(names)]
+  if EARLY_EXIT and VARIANT_SELECTION != "shadow" and "raw" in names and len(names) > 1:
+    stages = [["raw"], [name for name in names if name != "raw"]]
+  inputs, variants, scores = {}, {}, {}
+  for stage in stages:
+    if spec is None and stage != ["raw"]:
+      spec = Spectrogram(input_values, sr)
+    for name in stage:
+      inputs[name] = prepareInputs(audio if name == "raw" else cut(trim, VARIANTS[name](spec)))
+    #the variants of a stage are scored in one forward pass
+    variants.update(zip(stage, audioToPhonemeVariants([inputs[name] for name in stage], [cache_source(digest, name) for name in stage])))
+    for name in stage:
+      scores[name] = 1 - phoneme_error_rate(text_phonemes, variants[name][2])
+    if stage == ["raw"] and scores["raw"] >= EARLY_EXIT_SCORE:
+      break
+  evaluated = [name for name in VARIANT_ORDER if name in scores]
+  #the first of VARIANT_ORDER wins a tie
+  best = max(evaluated, key=scores.get)
+  best_score = scores[best]
+  if VARIANT_SELECTION == "shadow":
+    record_selection(analysis, chosen, scores, best)
+  audioPhonemes, char_offsets, transcription, logits = variants[best]
+  word_offsets = wordOffsetGet(inputs[best], logits, text_phonemes, phoneme_content)
+  if trim:
+    char_offsets = trim.map_offsets(char_offsets)
+    word_offsets = trim.map_offsets(word_offsets)
+
+  grouped_phonemes = groupPhonemes(audioPhonemes, word_offsets, char_offsets, forcedWordOffsets(logits, text_phonemes))
+  #per word error rates from one alignment of the whole passage, used to pick the practice words
+  _, word_errors = align(reference_words(text_phonemes, phoneme_content, word_phonemes), transcription)
+  duration = librosa.get_duration(y=input_values, sr=sr)
+  if best_score < 0:
+    best_score = 0
+  return {
+    "score": best_score,
+    "grouped_phonemes": grouped_phonemes,
+    "transcription": transcription,
+    "duration": duration,
+    "variants_evaluated": evaluated,
+    "word_errors": word_errors,
+    "ingest": ingest,
+  }
+
+def score_practice_audio(audio_file, text_phonemes):
+  input_values, ingest = load_audio(audio_file, sr)
+  trim = trim_silence(input_values, sr) if VAD else None
+  y_clean = cut(trim, denoise(input_values, sr, ("medfilt",))["medfilt"])
+  inputs = prepareInputs(y_clean)
+  audioPhonemes, char_offsets, transcription = audioToPhoneme(inputs, cache_source(audio_digest(input_values), "medfilt"))
+  duration = librosa.get_duration(y=input_values, sr=sr)
+  score_test = 1 - phoneme_error_rate(text_phonemes, transcription)
+  if score_test < 0:
+    score_test = 0
+  return {
+    "score": score_test,
+    "phonemes": audioPhonemes,
+    "transcription": transcription,
+    "duration": duration,
+    "ingest": ingest,
+  }
@@ -0,0 +1,119 @@
+import hashlib
+import logging
+import os
+import threading
+import numpy as np
+from scipy.special import log_softmax
+
+#On-disk cache of the phoneme model's per-frame log posteriors (float16 .npy files), keyed by a
+#SHA-256 of the decoded recording, the preprocessing that made the model input from it (denoise
+#variant, VAD and their settings) and the model version. A stored submission scored again (new
+#threshold, new reference text, another alignment method) then skips wav2vec2. The directory is shared by every
+#worker on the box and kept under max_bytes by evicting the least recently used files, a hit bumps
+#the file's mtime.
+
+logger = logging.getLogger(__name__)
+
+class PosteriorStore:
+  def __init__(self, directory, max_bytes):
+    self.directory = directory
+    self.max_bytes = max_bytes
+    self._lock = threading.Lock()
+    self._bytes = None
+    self._counts = {"hits": 0, "misses": 0, "stored": 0, "evicted": 0}
+
+  def key(self, audio_digest, preprocessing, model_version):
+    return hashlib.sha256(f"{model_version}\0{preprocessing}\0{audio_digest}".encode()).hexdigest()
+
+  def path(self, key):
+    return os.path.join(self.directory, key[:2], key + ".npy")
+
+  def get(self, key):
+    path = self.path(key)
+    try:
+      posteriors = np.load(path, allow_pickle=False)
+      os.utime(path)
+    except (FileNotFoundError, ValueError, OSError):
+      posteriors = None
+    with self._lock:
+      self._counts["hits" if posteriors is not None else "misses"] += 1
+    return posteriors
+
+  def put(self, key, posteriors):
+    path = self.path(key)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temporary = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(temporary, "wb") as f:
+      np.save(f, posteriors.astype(np.float16), allow_pickle=False)
+    os.replace(temporary, path)
+    with self._lock:
+      self._counts["stored"] += 1
+      if self._bytes is None:
+        self._bytes = self.scan_bytes()
+      else:
+        self._bytes += os.path.getsize(path)
+      over = self._bytes > self.max_bytes
+    if over:
+      self.evict()
+
+  def entries(self):
+    entries = []
+    for root, _, files in os.walk(self.directory):
+      for name in files:
+        if not name.endswith(".npy"):
+          continue
+        try:
+          stat = os.stat(os.path.join(root, name))
+        except FileNotFoundError:
+          continue
+        entries.append((stat.st_mtime, stat.st_size, os.path.join(root, name)))
+    return entries
+
+  def scan_bytes(self):
+    return sum(size for _, size, _ in self.entries())
+
+  #other workers write to the same directory, so the sizes are read from disk again here. Evicts down
+  #to 90% of the budget so every put right after does not walk the directory again.
+  def evict(self):
+    entries = sorted(self.entries())
+    total = sum(size for _, size, _ in entries)
+    evicted = 0
+    for _, size, path in entries:
+      if total <= self.max_bytes * 0.9:
+        break
+      try:
+        os.remove(path)
+        evicted += 1
+      except FileNotFoundError:
+        pass
+      total -= size
+    with self._lock:
+      self._bytes = total
+      self._counts["evicted"] += evicted
+    logger.info("posterior cache evicted %d files, %.1f MB left", evicted, total / 1e6)
+
+  def stats(self):
+    with self._lock:
+      stats = dict(self._counts)
+    lookups = stats["hits"] + stats["misses"]
+    stats["hit_ratio"] = stats["hits"] / lookups if lookups else None
+    return stats
+
+#sha256 of a decoded recording (float32 samples at the model's rate), before any preprocessing
+def audio_digest(y):
+  return hashlib.sha256(np.ascontiguousarray(y, dtype=np.float32)).hexdigest()
+
+#keys holds store.key() of each array. Runs only the inputs that are not cached through run (a list of 1-D arrays -> list of logits) and
+#stores their posteriors. Cached or not, the result is the float16 log posteriors as float32, so a
+#submission scores the same either way (argmax and the forced alignment are unchanged by log_softmax).
+def cached_posteriors(store, keys, arrays, run):
+  posteriors = [store.get(key) for key in keys]
+  missing = [i for i, p in enumerate(posteriors) if p is None]
+  if missing:
+    for i, logits in zip(missing, run([arrays[i] for i in missing])):
+      posteriors[i] = log_softmax(logits.astype(np.float32), axis=-1).astype(np.float16)
+      try:
+        store.put(keys[i], posteriors[i])
+      except OSError:
+        logger.warning("could not write to the posterior cache", exc_info=True)
+  return [p.astype(np.float32) for p in posteriors]
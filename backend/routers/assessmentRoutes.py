@@ -1,5 +1,6 @@
 from fastapi import APIRouter, Depends, HTTPException, UploadFile,Form, File
-from phoneme import wordOffsetGet, textToPhoneme, audioToPhoneme, groupPhonemes, processor, processor2, model, model2, sr
+from phoneme import wordIndex, indexPhonemes
+from executors import run_io
 from dependencies import get_db
 import models
 from pydantic import BaseModel
@@ -62,7 +63,9 @@ async def create_phoneme_assessment(
   assessment_type: int = Form(...), 
   audio_file: Optional[UploadFile] = File(None)):
   
-  phoneme_text, raw_phones = textToPhoneme(input_text)
+  #the lexicon reads and writes its database table, so it runs on the io pool
+  word_index = await run_io(wordIndex, input_text)
+  phoneme_text, raw_phones = indexPhonemes(word_index)
   audio_url = None
   audio_public_id = None
   
@@ -77,6 +80,7 @@ async def create_phoneme_assessment(
                                                phoneme_content = phoneme_text, 
                                                assessment_type = assessment_type, 
                                                raw_phoneme_content = raw_phones, 
+                                               word_index = word_index, 
                                                teacher_id = teacher_id, 
                                                audio_url = audio_url,
                                                audio_public_id = audio_public_id)
@@ -218,7 +222,9 @@ async def edit_assessment(
   html_text: str = Form(...),
   assessment_type: int = Form(...), 
   audio_file: Optional[UploadFile] = File(None)):
-  phoneme_text, raw_phones = textToPhoneme(input_text)
+  #the lexicon reads and writes its database table, so it runs on the io pool
+  word_index = await run_io(wordIndex, input_text)
+  phoneme_text, raw_phones = indexPhonemes(word_index)
   audio_url = None
   audio_public_id = None
   
@@ -237,6 +243,7 @@ async def edit_assessment(
   db_assessment.raw_phoneme_content = raw_phones
   db_assessment.text_content = input_text
   db_assessment.phoneme_content = phoneme_text
+  db_assessment.word_index = word_index
   db_assessment.assessment_type = assessment_type
   db_assessment.text_html = html_text
   db_assessment.assessment_type = assessment_type
@@ -1,23 +1,22 @@
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Header
 from dependencies import get_db
 import models
-import librosa
-from phoneme import wordOffsetGet, textToPhoneme, audioToPhoneme, groupPhonemes, processor, processor2, model, model2, sr
+from phoneme import textToPhoneme, cleanWord
+from pipeline import score_phoneme_audio, score_practice_audio
+from executors import scoring_slot, run_in_scoring_pool, run_io
+from duplicates import audio_fingerprint, find_duplicate, single_flight
+from jobs import create_job, find_job, start_worker, wake_workers, job_status, job_urls, job_events
+from config import SUBMISSION_JOBS, PRACTICE_WORD_ERROR, JOB_WORKER_IN_API, SCORING_WORKERS
+from storage import start_upload, discard_upload, spool_owner
 from pydantic import BaseModel
 from typing import List, Optional, Annotated 
 from sqlalchemy.orm import Session
-import cloudinary
-import cloudinary.uploader
-from jiwer import wer
 from datetime import datetime, timezone
-from starlette.responses import JSONResponse
-import numpy as np
-from scipy.signal import medfilt
+from starlette.responses import JSONResponse, StreamingResponse
+import io
 import soundfile as sf
 import scipy.fftpack as fft
 import pytz
-import re
-import noisereduce as nr
 router = APIRouter(
     prefix="/submissions",
     tags=["Submissions"]
@@ -52,7 +51,8 @@ class PhonemeSubmission(BaseModel):
   assessment_title: str
   text_content: str
   # text_html: str
-  student_audio_url: str
+  #None while the upload is spooled, see storage.flush_spool
+  student_audio_url: Optional[str] = None
   assessment_audio_url: str
   phoneme_content: List[str]
   phoneme_output: List[str]
@@ -81,8 +81,96 @@ async def submit_phoneme_assessment(db: db_dependency, student_id: int,
   assessment_id: int,
   stage_id: int,
   file: UploadFile = File(...),
-  file2: UploadFile = File(...)):
-  #might be best to separate this into another function
+  file2: Optional[UploadFile] = File(None),
+  idempotency_key: Optional[str] = Header(None),
+  job: Optional[bool] = None):
+  #a repeat of a recent submission gets the saved result back, see duplicates.py
+  audio_hash = await run_io(audio_fingerprint, file.file, "phoneme", assessment_id)
+  duplicate = await run_io(find_duplicate, db, models.AssessmentHistory, student_id, {"assessment_id": assessment_id}, audio_hash, idempotency_key)
+  if duplicate:
+    return JSONResponse(phoneme_history_response(duplicate))
+  if SUBMISSION_JOBS if job is None else job:
+    #validated here so a bad request still gets its 4xx, the scoring is left to the job (see jobs.py)
+    await run_io(get_phoneme_submission_context, db, student_id, assessment_id, stage_id)
+    job_id = await run_io(enqueue_submission, db, "phoneme", student_id, {"assessment_id": assessment_id, "stage_id": stage_id},
+                          file.file, file2.file if file2 else None, audio_hash, idempotency_key)
+    job_queued()
+    return JSONResponse(job_urls(job_id), status_code=202)
+  response_data = await single_flight(("phoneme", student_id, assessment_id, idempotency_key or audio_hash), lambda: process_phoneme_submission(
+    db, student_id, assessment_id, stage_id, file.file, file2.file if file2 else None, audio_hash, idempotency_key))
+
+  # Return the response
+  return JSONResponse(response_data)
+
+#audio_file is scored, storage_file is uploaded, both are file objects. Without storage_file the
+#scored recording is uploaded (see storage.start_upload).
+async def process_phoneme_submission(db: Session, student_id: int, assessment_id: int, stage_id: int, audio_file, storage_file, audio_hash=None, idempotency_key=None):
+  #blocking work runs on the executors in executors.py so the event loop stays free for other requests
+  db_assessment, db_user, db_stage = await run_io(get_phoneme_submission_context, db, student_id, assessment_id, stage_id)
+  #uploaded while the recording is scored (see storage.py), once the submission has its scoring slot
+  with scoring_slot():
+    audio_file, upload = await start_upload(audio_file, storage_file)
+    try:
+      word_phonemes = [entry["raw_phonemes"] for entry in db_assessment.word_index] if db_assessment.word_index else None
+      result = await run_in_scoring_pool(score_phoneme_audio, audio_file, db_assessment.raw_phoneme_content, db_assessment.phoneme_content, word_phonemes)
+    except HTTPException:
+      discard_upload(upload)
+      raise
+    except Exception as e:
+      discard_upload(upload)
+      raise HTTPException(status_code=500, detail=f"Error processing audio file: {str(e)}")
+  upload_result = await upload
+  return await run_io(save_phoneme_submission, db, student_id, assessment_id, stage_id, db_assessment, db_user, db_stage, result, upload_result,
+                      audio_hash, idempotency_key)
+
+#a job retried after its worker died may have been saved already
+async def run_phoneme_job(db: Session, job):
+  duplicate = await run_io(find_duplicate, db, models.AssessmentHistory, job.student_id, {"assessment_id": job.params["assessment_id"]},
+                           job.audio_hash, job.idempotency_key)
+  if duplicate:
+    return phoneme_history_response(duplicate)
+  return await process_phoneme_submission(db, job.student_id, job.params["assessment_id"], job.params["stage_id"],
+                                          io.BytesIO(job.audio), stored_upload(job), job.audio_hash, job.idempotency_key)
+
+#None for a single upload submission, the scored recording is stored then
+def stored_upload(job):
+  return io.BytesIO(job.storage_audio) if job.storage_audio is not None else None
+
+#lets a worker know about a queued job, starting this process's worker first if it is not running yet
+def job_queued():
+  if JOB_WORKER_IN_API:
+    start_worker(JOB_HANDLERS, SCORING_WORKERS)
+  wake_workers()
+
+#the job already queued for the same params and upload or idempotency key, otherwise a new one holding both uploads
+def enqueue_submission(db: Session, kind: str, student_id: int, params, audio_file, storage_file, audio_hash, idempotency_key):
+  job_id = find_job(db, kind, student_id, params, audio_hash, idempotency_key)
+  if job_id:
+    return job_id
+  audio_file.seek(0)
+  audio = audio_file.read()
+  storage_audio = None
+  if storage_file is not None:
+    storage_file.seek(0)
+    storage_audio = storage_file.read()
+  return create_job(db, kind, student_id, params, audio, storage_audio, audio_hash, idempotency_key)
+
+#the response of a submission that was already saved, practice words were added the first time
+def phoneme_history_response(db_submission):
+  return {
+      "score": db_submission.score,
+      "audio_url": db_submission.audio_url,
+      "audio_id": db_submission.audio_public_id,
+      "phoneme_output": db_submission.phoneme_output,
+      "transcription": db_submission.raw_phoneme_output,
+      "practice_words_added": [],
+      "practice_words_id": [],
+      "history_id": db_submission.history_id,
+      "variants_evaluated": [],
+      "duplicate": True
+  }
+
+def get_phoneme_submission_context(db: Session, student_id: int, assessment_id: int, stage_id: int):
   db_assessment = db.query(models.PronunciationAssessment).filter(models.PronunciationAssessment.assessment_id == assessment_id).first()
   if not db_assessment:
     raise HTTPException(status_code=404, detail='Assessment is not found')
@@ -98,57 +186,14 @@ async def submit_phoneme_assessment(db: db_dependency, student_id: int,
     print(f"User Level: {db_user.level}")
 
     raise HTTPException(status_code=400, detail='Stage requirements not met')
-  try:
-    text_phonemes = db_assessment.raw_phoneme_content
-    input_values, _ = librosa.load(file.file, sr=sr)
-    S_full, phase = librosa.magphase(librosa.stft(input_values))
-    noise_power = np.mean(S_full[:, :int(sr*0.1)], axis=1)
-    mask = S_full > noise_power[:, None]
-    mask = mask.astype(float)
-    mask = medfilt(mask, kernel_size=(1,5))
-    S_clean = S_full * mask
-    y_clean = librosa.istft(S_clean * phase)
-    y_clean2 = nr.reduce_noise(y=input_values, sr=sr, stationary=True)
-    inputsMedfilt = processor(y_clean, return_tensors="pt", padding=True)
-    inputsNoFilter = processor(input_values, return_tensors="pt", padding=True)
-    inputsNoiseReduce = processor(y_clean2, return_tensors="pt", padding=True)
-    # inputs = processor(y_clean, return_tensors="pt", padding=True)
-    phonem1, offset, predicted_phonemes = audioToPhoneme(inputsMedfilt)
-    phonem2, offset2, predicted_phonemes2 = audioToPhoneme(inputsNoFilter)
-    phonem3, offset3, predicted_phonemes3 = audioToPhoneme(inputsNoiseReduce)
-    score_test1 = 1-wer(' '.join(text_phonemes), ' '.join(predicted_phonemes))
-    score_test2 = 1-wer(' '.join(text_phonemes), ' '.join(predicted_phonemes2))
-    score_test3 = 1-wer(' '.join(text_phonemes), ' '.join(predicted_phonemes3))
-    best_score = max(score_test1, score_test2, score_test3)
-    if best_score == score_test1:
-        # best_method = "Median Filtering"
-        word_offsets = wordOffsetGet(inputsMedfilt)
-        audioPhonemes = phonem1
-        char_offsets = offset
-        transcription = predicted_phonemes
-    elif best_score == score_test2:
-        # best_method = "No Filter (Raw Audio)"
-        word_offsets = wordOffsetGet(inputsNoFilter)
-        audioPhonemes = phonem2
-        char_offsets = offset2
-        transcription = predicted_phonemes2
-    elif best_score == score_test3:
-        # best_method = "NoiseReduce"
-        word_offsets = wordOffsetGet(inputsNoiseReduce)
-        audioPhonemes = phonem3
-        char_offsets = offset3
-        transcription = predicted_phonemes3
-    
-    grouped_phonemes = groupPhonemes(audioPhonemes, word_offsets, char_offsets)
-    duration = librosa.get_duration(y=input_values, sr=sr)
-#     print(' '.join(transcription))
-#     print(' '.join(text_phonemes))
-    if best_score < 0:
-      best_score = 0
-    # print(score_test)
-  except Exception as e:
-    raise HTTPException(status_code=500, detail=f"Error processing audio file: {str(e)}")
-  upload_result = cloudinary.uploader.upload(file2.file, resource_type="auto")
+  return db_assessment, db_user, db_stage
+
+def save_phoneme_submission(db: Session, student_id: int, assessment_id: int, stage_id: int, db_assessment, db_user, db_stage, result, upload_result,
+                            audio_hash=None, idempotency_key=None):
+  best_score = result["score"]
+  grouped_phonemes = result["grouped_phonemes"]
+  transcription = result["transcription"]
+  duration = result["duration"]
   db_submission = models.AssessmentHistory(
     student_id = student_id,
     assessment_id = assessment_id,
@@ -159,11 +204,14 @@ async def submit_phoneme_assessment(db: db_dependency, student_id: int,
     raw_phoneme_output = transcription,
     audio_public_id = upload_result["public_id"],
     stage_id = stage_id,
-    duration = duration
+    duration = duration,
+    audio_hash = audio_hash,
+    idempotency_key = idempotency_key
     )
   
   db.add(db_submission)
   db.commit()
+  spool_owner(upload_result, "phoneme", db_submission.history_id)
   
   #stage_is_completed = check_stage_completion(student_id, db_stage, db)
   if round(best_score*100, 2)>=40 and db_user.current_stage == db_stage.stage_sequence:
@@ -172,27 +220,24 @@ async def submit_phoneme_assessment(db: db_dependency, student_id: int,
     raise HTTPException(status_code=400, detail='Stage requirements not met 1')
    
   practice_words = []
+  practice_indices = []
   practice_db = []
   expected_words = db_assessment.text_content.split(' ')
-  expected_phonemes = db_assessment.phoneme_content
-  student_words = grouped_phonemes 
-  word_index = 0
-  for expected_word in expected_words:
-      if word_index < len(student_words) and word_index < len(expected_phonemes):
-          expected_phoneme = expected_phonemes[word_index]
-          student_phoneme = student_words[word_index]
-          word_wer = wer(expected_phoneme, student_phoneme)
-          if word_wer > 0.5 and len(expected_word) > 1:  #testing here
+  #phoneme error rate of each expected word, from the alignment in scoring.align
+  word_errors = result["word_errors"]
+  for word_index, expected_word in enumerate(expected_words):
+      if word_index < len(word_errors) and word_errors[word_index] is not None:
+          if word_errors[word_index] > PRACTICE_WORD_ERROR and len(expected_word) > 1:  #testing here
               practice_words.append(expected_word)
-      word_index += 1
+              practice_indices.append(word_index)
 
     # Add practice words if any
   existing_practice_words = [set(word.words)
                              for word in db.query(models.PracticeWords).filter(models.PracticeWords.student_id == student_id).all()]
   if practice_words:
       try:
-        for word in practice_words:
-          cleaned_word = clean_word(word)
+        for word, index in zip(practice_words, practice_indices):
+          cleaned_word, raw_phoneme = reference_word(db_assessment, index, word)
           word_list = list(cleaned_word)
           word_set = set(word_list)
           # print(word_list)
@@ -207,7 +252,6 @@ async def submit_phoneme_assessment(db: db_dependency, student_id: int,
           # ).first()
           # if existing_practice_word:
           #   continue
-          text, raw_phoneme = textToPhoneme(word) 
           create_practice_words_model = models.PracticeWords(
             student_id=student_id,
             assessment_id=assessment_id,
@@ -233,14 +277,19 @@ async def submit_phoneme_assessment(db: db_dependency, student_id: int,
       "transcription": transcription,
       "practice_words_added": practice_words,
       "practice_words_id": practice_db,
-      "history_id": db_submission.history_id
+      "history_id": db_submission.history_id,
+      "variants_evaluated": result["variants_evaluated"]
   }
 
-  # Return the response
-  return JSONResponse(response_data)
+  return response_data
 
-def clean_word(word):
-  return re.sub(r"[^\w\s'-]", '', word)
+#the per word reference saved with the assessment (see phoneme.wordIndex), assessments saved before
+#it existed fall back to converting the word again
+def reference_word(db_assessment, index, word):
+  entries = db_assessment.word_index
+  if entries and index < len(entries) and entries[index]["word"] == word:
+    return entries[index]["clean"], entries[index]["raw_phonemes"]
+  return cleanWord(word), textToPhoneme(word)[1]
 
 @router.post("/submit/comprehension/")
 async def submit_comprehension_assessment(db: db_dependency, submission: ComprehensionSubmission):
@@ -297,33 +346,62 @@ async def submit_practice_word(db: db_dependency,
   student_id: int,
   practice_id: int,
   file: UploadFile = File(...),
-  file2: UploadFile = File(...),):
-  
+  file2: Optional[UploadFile] = File(None),
+  idempotency_key: Optional[str] = Header(None),
+  job: Optional[bool] = None):
+  audio_hash = await run_io(audio_fingerprint, file.file, "practice", practice_id)
+  duplicate = await run_io(find_duplicate, db, models.PracticeWordSubmissionHistory, student_id, {"practice_id": practice_id}, audio_hash, idempotency_key)
+  if duplicate:
+    return {'score': duplicate.score, 'duplicate': True}
+  if SUBMISSION_JOBS if job is None else job:
+    await run_io(get_practice_word, db, practice_id)
+    job_id = await run_io(enqueue_submission, db, "practice", student_id, {"practice_id": practice_id},
+                          file.file, file2.file if file2 else None, audio_hash, idempotency_key)
+    job_queued()
+    return JSONResponse(job_urls(job_id), status_code=202)
+  score_test = await single_flight(("practice", student_id, practice_id, idempotency_key or audio_hash), lambda: process_practice_submission(
+    db, student_id, practice_id, file.file, file2.file if file2 else None, audio_hash, idempotency_key))
+
+  return {'score': round(score_test*100, 2)}
+
+async def process_practice_submission(db: Session, student_id: int, practice_id: int, audio_file, storage_file, audio_hash=None, idempotency_key=None):
+  db_practice = await run_io(get_practice_word, db, practice_id)
+  with scoring_slot():
+    audio_file, upload = await start_upload(audio_file, storage_file)
+    try:
+      result = await run_in_scoring_pool(score_practice_audio, audio_file, db_practice.raw_phoneme_content)
+    except HTTPException:
+      discard_upload(upload)
+      raise
+    except Exception as e:
+      discard_upload(upload)
+      raise HTTPException(status_code=500, detail=f"Error processing audio file: {str(e)}")
+  upload_result = await upload
+  return await run_io(save_practice_submission, db, student_id, practice_id, db_practice, result, upload_result, audio_hash, idempotency_key)
+
+async def run_practice_job(db: Session, job):
+  duplicate = await run_io(find_duplicate, db, models.PracticeWordSubmissionHistory, job.student_id, {"practice_id": job.params["practice_id"]},
+                           job.audio_hash, job.idempotency_key)
+  if duplicate:
+    return {'score': duplicate.score, 'duplicate': True}
+  score_test = await process_practice_submission(db, job.student_id, job.params["practice_id"], io.BytesIO(job.audio), stored_upload(job),
+                                                 job.audio_hash, job.idempotency_key)
+  return {'score': round(score_test*100, 2)}
+
+#what the scoring workers run for each kind of job, see jobs.work
+JOB_HANDLERS = {"phoneme": run_phoneme_job, "practice": run_practice_job}
+
+def get_practice_word(db: Session, practice_id: int):
   db_practice = db.query(models.PracticeWords).filter(models.PracticeWords.practice_id == practice_id).first()
   if not db_practice:
     raise HTTPException(status_code=404, detail="Practice word not found.")
-  
-  text_phonemes = db_practice.raw_phoneme_content
-  input_values, _ = librosa.load(file.file, sr=sr)
-  
-  S_full, phase = librosa.magphase(librosa.stft(input_values))
-  noise_power = np.mean(S_full[:, :int(sr*0.1)], axis=1)
-  mask = S_full > noise_power[:, None]
-  mask = mask.astype(float)
-  mask = medfilt(mask, kernel_size=(1,5))
-  S_clean = S_full * mask
-  y_clean = librosa.istft(S_clean * phase)
-  
-  inputs = processor(y_clean, return_tensors="pt", padding=True)
-  audioPhonemes, char_offsets, transcription = audioToPhoneme(inputs)
-  duration = librosa.get_duration(y=input_values, sr=sr)
-  # print(text_phonemes)
-  # print(transcription)
-  score_test = 1 - wer(' '.join(text_phonemes), ' '.join(transcription))
-  if score_test < 0:
-    score_test = 0
-  upload_result = cloudinary.uploader.upload(file2.file, resource_type="auto")
-  
+  return db_practice
+
+def save_practice_submission(db: Session, student_id: int, practice_id: int, db_practice, result, upload_result, audio_hash=None, idempotency_key=None):
+  score_test = result["score"]
+  audioPhonemes = result["phonemes"]
+  transcription = result["transcription"]
+  duration = result["duration"]
   db_submission = models.PracticeWordSubmissionHistory(
     student_id = student_id,
     practice_id = practice_id,
@@ -333,15 +411,34 @@ async def submit_practice_word(db: db_dependency,
     audio_url = upload_result["secure_url"],
     audio_public_id = upload_result["public_id"],
     raw_phoneme_output = transcription,
-    duration = duration
+    duration = duration,
+    audio_hash = audio_hash,
+    idempotency_key = idempotency_key
   )
   db.add(db_submission)
   if round(score_test * 100, 2) >= 50:
     db_practice.is_completed = True
     
   db.commit()
+  spool_owner(upload_result, "practice", db_submission.history_id)
   
-  return {'score': round(score_test*100, 2)}
+  return score_test
+
+#status of a submission job, "result" is what the synchronous endpoint would have returned
+@router.get("/jobs/{job_id}")
+async def get_submission_job(job_id: str):
+  status = await run_io(job_status, job_id)
+  if not status:
+    raise HTTPException(status_code=404, detail='Job is not found')
+  return status
+
+#the same as server-sent events, one per status change until the job is done or failed
+@router.get("/jobs/{job_id}/events")
+async def get_submission_job_events(job_id: str):
+  status = await run_io(job_status, job_id)
+  if not status:
+    raise HTTPException(status_code=404, detail='Job is not found')
+  return StreamingResponse(job_events(job_id), media_type="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
 @router.get("/practice/student/{student_id}")
 async def get_student_practice_submissions(student_id:int, db: db_dependency):
@@ -0,0 +1,213 @@
+import asyncio
+import io
+import json
+import logging
+import os
+import time
+import urllib.request
+import uuid
+import models
+from database import SessionLocal
+from executors import io_executor, run_io
+from config import STORAGE_BACKEND, STORAGE_DIR, STORAGE_RETRIES, STORAGE_SPOOL_DIR, STORAGE_SPOOL_RETRY_SECONDS, STORAGE_ENCODING
+
+#Where the students' recordings are kept. The submission endpoints upload through the client returned by
+#get_storage() (cloudinary, or a directory on disk for tests and benchmarks, see set_storage), while
+#the recording is being scored. An upload that still fails after STORAGE_RETRIES tries is spooled to
+#STORAGE_SPOOL_DIR, the submission is saved without an audio url and flush_spool() uploads it later and
+#fills in the history row's audio_url and audio_public_id.
+
+logger = logging.getLogger(__name__)
+
+HISTORY_MODELS = {"phoneme": models.AssessmentHistory, "practice": models.PracticeWordSubmissionHistory}
+
+class CloudinaryStorage:
+  def upload(self, audio_file):
+    import cloudinary.uploader
+    result = cloudinary.uploader.upload(audio_file, resource_type="auto")
+    return {"secure_url": result["secure_url"], "public_id": result["public_id"]}
+
+  def download(self, audio_url):
+    with urllib.request.urlopen(audio_url, timeout=60) as response:
+      return response.read()
+
+  def delete(self, public_id):
+    import cloudinary.uploader
+    cloudinary.uploader.destroy(public_id, resource_type="video")
+
+#keeps the uploads in a directory, latency (seconds) stands in for the round trip to the real service
+class LocalStorage:
+  def __init__(self, directory, latency=0.0):
+    self.directory = directory
+    self.latency = latency
+
+  def upload(self, audio_file):
+    time.sleep(self.latency)
+    os.makedirs(self.directory, exist_ok=True)
+    public_id = uuid.uuid4().hex
+    path = os.path.join(self.directory, public_id)
+    with open(path, "wb") as f:
+      f.write(audio_file.read())
+    return {"secure_url": "file://" + os.path.abspath(path), "public_id": public_id}
+
+  def download(self, audio_url):
+    with open(audio_url[len("file://"):] if audio_url.startswith("file://") else audio_url, "rb") as f:
+      return f.read()
+
+  def delete(self, public_id):
+    try:
+      os.remove(os.path.join(self.directory, public_id))
+    except FileNotFoundError:
+      pass
+
+_storage = None
+
+def get_storage():
+  global _storage
+  if _storage is None:
+    _storage = LocalStorage(STORAGE_DIR) if STORAGE_BACKEND == "local" else CloudinaryStorage()
+  return _storage
+
+def set_storage(storage):
+  global _storage
+  _storage = storage
+
+#the wav sample formats FLAC holds without loss, and what they are written as
+FLAC_SUBTYPES = {"PCM_U8": "PCM_S8", "PCM_S8": "PCM_S8", "PCM_16": "PCM_16", "PCM_24": "PCM_24"}
+
+#the recording re-encoded to FLAC (lossless, about half the size of PCM wav) at the wav's own bit depth,
+#or as it was uploaded when soundfile can not read it (webm, m4a), it is compressed already or its
+#samples do not fit FLAC (float and 32 bit wav)
+def reencode(data, encoding):
+  import soundfile
+  if encoding != "flac":
+    return data
+  try:
+    info = soundfile.info(io.BytesIO(data))
+    if info.format != "WAV" or info.subtype not in FLAC_SUBTYPES:
+      return data
+    y, sample_rate = soundfile.read(io.BytesIO(data), dtype="int32")
+  except soundfile.LibsndfileError:
+    return data
+  encoded = io.BytesIO()
+  soundfile.write(encoded, y, sample_rate, format="FLAC", subtype=FLAC_SUBTYPES[info.subtype])
+  return encoded.getvalue()
+
+#uploads with retries. When every try fails the recording is spooled and the result has no url, only its spool_id
+def upload_audio(audio_file, encoding=None):
+  audio_file.seek(0)
+  data = audio_file.read()
+  if encoding:
+    data = reencode(data, encoding)
+  for attempt in range(STORAGE_RETRIES):
+    try:
+      return get_storage().upload(io.BytesIO(data))
+    except Exception:
+      logger.warning("audio upload attempt %d of %d failed", attempt + 1, STORAGE_RETRIES, exc_info=True)
+      if attempt + 1 < STORAGE_RETRIES:
+        time.sleep(0.5 * 2 ** attempt)
+  spool_id = uuid.uuid4().hex
+  os.makedirs(STORAGE_SPOOL_DIR, exist_ok=True)
+  with open(os.path.join(STORAGE_SPOOL_DIR, spool_id + ".audio"), "wb") as f:
+    f.write(data)
+  logger.error("audio upload failed, spooled as %s", spool_id)
+  return {"secure_url": None, "public_id": None, "spool_id": spool_id}
+
+#records which history row the spooled recording belongs to, flush_spool only uploads recordings that have one
+def spool_owner(upload_result, kind, history_id):
+  spool_id = upload_result.get("spool_id")
+  if not spool_id:
+    return
+  path = os.path.join(STORAGE_SPOOL_DIR, spool_id + ".json")
+  with open(path + ".tmp", "w") as f:
+    json.dump({"kind": kind, "history_id": history_id}, f)
+  os.replace(path + ".tmp", path)
+
+def read_all(audio_file):
+  audio_file.seek(0)
+  return audio_file.read()
+
+#started when the request arrives so the upload runs while the recording is scored. Without a separate
+#storage_file (a single upload submission) the scored recording is the one stored, re-encoded to
+#STORAGE_ENCODING. It is read into memory once and scoring and the upload get their own BytesIO over
+#the same bytes, so score with the returned audio_file.
+async def start_upload(audio_file, storage_file=None):
+  encoding = None
+  if storage_file is None:
+    data = await run_io(read_all, audio_file)
+    audio_file, storage_file, encoding = io.BytesIO(data), io.BytesIO(data), STORAGE_ENCODING
+  return audio_file, asyncio.ensure_future(run_io(upload_audio, storage_file, encoding))
+
+def _discard(result):
+  try:
+    if result["public_id"]:
+      get_storage().delete(result["public_id"])
+    elif result.get("spool_id"):
+      os.remove(os.path.join(STORAGE_SPOOL_DIR, result["spool_id"] + ".audio"))
+  except Exception:
+    logger.warning("could not discard the upload of a failed submission", exc_info=True)
+
+#the submission failed after its upload was started, the recording is deleted once the upload is done
+def discard_upload(upload):
+  upload.add_done_callback(lambda f: None if f.cancelled() or f.exception() else io_executor.submit(_discard, f.result()))
+
+#uploads the spooled recordings and back-fills their history rows, returns how many were uploaded. A
+#recording is claimed by renaming its .json, so several processes can flush the same spool. Recordings
+#that never got an owner (the process died before saving the submission) are removed after a day, and
+#claims left by a process that died while flushing are given up after an hour.
+def flush_spool():
+  if not os.path.isdir(STORAGE_SPOOL_DIR):
+    return 0
+  uploaded = 0
+  names = os.listdir(STORAGE_SPOOL_DIR)
+  owned = {name.split(".")[0] for name in names if ".json" in name}
+  for name in names:
+    path = os.path.join(STORAGE_SPOOL_DIR, name)
+    try:
+      age = time.time() - os.path.getmtime(path)
+      if name.endswith(".audio") and name.split(".")[0] not in owned and age > 86400:
+        os.remove(path)
+      elif ".json." in name and not name.endswith(".tmp") and age > 3600:
+        os.rename(path, os.path.join(STORAGE_SPOOL_DIR, name.split(".")[0] + ".json"))
+    except FileNotFoundError:
+      pass
+  for name in os.listdir(STORAGE_SPOOL_DIR):
+    if not name.endswith(".json"):
+      continue
+    spool_id = name[:-len(".json")]
+    path = os.path.join(STORAGE_SPOOL_DIR, name)
+    claimed = f"{path}.{os.getpid()}"
+    try:
+      os.rename(path, claimed)
+      os.utime(claimed)
+    except FileNotFoundError:
+      continue
+    audio_path = os.path.join(STORAGE_SPOOL_DIR, spool_id + ".audio")
+    try:
+      with open(claimed) as f:
+        owner = json.load(f)
+      with open(audio_path, "rb") as f:
+        result = get_storage().upload(f)
+      history_model = HISTORY_MODELS[owner["kind"]]
+      with SessionLocal() as db:
+        db.query(history_model).filter(history_model.history_id == owner["history_id"]).update(
+          {"audio_url": result["secure_url"], "audio_public_id": result["public_id"]})
+        db.commit()
+    except Exception:
+      logger.warning("could not upload spooled recording %s, will try again", spool_id, exc_info=True)
+      os.rename(claimed, path)
+      continue
+    os.remove(audio_path)
+    os.remove(claimed)
+    uploaded += 1
+  return uploaded
+
+async def flush_spool_forever():
+  while True:
+    try:
+      uploaded = await run_io(flush_spool)
+      if uploaded:
+        logger.info("uploaded %d spooled recordings", uploaded)
+    except Exception:
+      logger.exception("flushing the audio spool failed")
+    await asyncio.sleep(STORAGE_SPOOL_RETRY_SECONDS)
@@ -0,0 +1,36 @@
+#run from backend/: python -m pytest tests
+#tests that need Postgres use READSPEAK_TEST_DATABASE_URL (a scratch database, its tables are created
+#and emptied) and are skipped without it
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+@pytest.fixture
+def database():
+  url = os.environ.get("READSPEAK_TEST_DATABASE_URL")
+  if not url:
+    pytest.skip("READSPEAK_TEST_DATABASE_URL is not set")
+  import models
+  engine = create_engine(url)
+  models.Base.metadata.create_all(bind=engine)
+  Session = sessionmaker(bind=engine, autoflush=False)
+  yield Session
+  with engine.begin() as connection:
+    for table in reversed(models.Base.metadata.sorted_tables):
+      connection.execute(table.delete())
+  engine.dispose()
+
+#uploads go to a temporary directory for the length of a test
+@pytest.fixture
+def local_storage(tmp_path):
+  import storage
+  previous = storage._storage
+  client = storage.LocalStorage(str(tmp_path / "storage"))
+  storage.set_storage(client)
+  yield client
+  storage.set_storage(previous)
@@ -0,0 +1,78 @@
+import io
+import os
+from datetime import datetime
+import numpy as np
+import soundfile
+import models
+import storage
+from archive import archive_recording, save_archived
+
+def recording(seconds=5, sample_rate=16000):
+  t = np.arange(seconds * sample_rate) / sample_rate
+  phase = 2 * np.pi * np.cumsum(140 + 30 * np.sin(2 * np.pi * 0.5 * t)) / sample_rate
+  y = sum(np.sin(k * phase) / k for k in range(1, 15)) * 0.2
+  encoded = io.BytesIO()
+  soundfile.write(encoded, y.astype(np.float32), sample_rate, format="WAV", subtype="PCM_16")
+  return encoded.getvalue()
+
+def test_archive_recording_uploads_smaller_opus(local_storage):
+  original = local_storage.upload(io.BytesIO(recording()))
+  result = archive_recording("phoneme", 7, original["secure_url"], 24)
+  assert result["history_id"] == 7 and result["audio_url"] and result["audio_public_id"] != original["public_id"]
+  assert result["archive_bytes"] < result["original_bytes"] / 5
+  opus = local_storage.download(result["audio_url"])
+  assert len(opus) == result["archive_bytes"]
+  info = soundfile.info(io.BytesIO(opus))
+  assert (info.format, info.subtype, info.channels, info.samplerate) == ("OGG", "OPUS", 1, 16000)
+  assert abs(info.duration - 5) < 0.1
+
+def test_archive_recording_keeps_what_opus_does_not_shrink(local_storage):
+  tiny = io.BytesIO()
+  soundfile.write(tiny, np.zeros(160, dtype=np.float32), 16000, format="WAV", subtype="PCM_16")
+  original = local_storage.upload(io.BytesIO(tiny.getvalue()))
+  result = archive_recording("practice", 3, original["secure_url"], 24)
+  assert result["audio_url"] is None and result["archive_bytes"] == result["original_bytes"]
+  assert os.listdir(local_storage.directory) == [original["public_id"]]
+
+class FailingDelete(storage.LocalStorage):
+  def delete(self, public_id):
+    raise OSError("destroy failed")
+
+def saved_row(Session, audio_url, public_id):
+  with Session() as db:
+    row = models.AssessmentHistory(score=50, audio_url=audio_url, audio_public_id=public_id, date_taken=datetime(2024, 1, 1))
+    db.add(row)
+    db.commit()
+    return row.history_id
+
+def test_save_archived_replaces_the_recording(database, local_storage):
+  original = local_storage.upload(io.BytesIO(recording()))
+  history_id = saved_row(database, original["secure_url"], original["public_id"])
+  result = archive_recording("phoneme", history_id, original["secure_url"], 24)
+  with database() as db:
+    assert save_archived(db, models.AssessmentHistory, result, original["secure_url"], original["public_id"]) == "archived"
+    row = db.get(models.AssessmentHistory, history_id)
+    assert (row.audio_url, row.archive_bytes, row.archive_original_bytes) == (result["audio_url"], result["archive_bytes"], result["original_bytes"])
+  assert os.listdir(local_storage.directory) == [result["audio_public_id"]]
+
+def test_save_archived_survives_a_failed_delete(database, tmp_path):
+  client = FailingDelete(str(tmp_path / "storage"))
+  storage.set_storage(client)
+  try:
+    original = client.upload(io.BytesIO(recording()))
+    history_id = saved_row(database, original["secure_url"], original["public_id"])
+    result = archive_recording("phoneme", history_id, original["secure_url"], 24)
+    with database() as db:
+      assert save_archived(db, models.AssessmentHistory, result, original["secure_url"], original["public_id"]) == "failed"
+      assert db.get(models.AssessmentHistory, history_id).audio_url == result["audio_url"]
+  finally:
+    storage.set_storage(None)
+
+def test_save_archived_leaves_a_changed_row(database, local_storage):
+  original = local_storage.upload(io.BytesIO(recording()))
+  history_id = saved_row(database, "file:///somewhere/else", "else")
+  result = archive_recording("phoneme", history_id, original["secure_url"], 24)
+  with database() as db:
+    assert save_archived(db, models.AssessmentHistory, result, original["secure_url"], original["public_id"]) == "changed"
+    assert db.get(models.AssessmentHistory, history_id).audio_url == "file:///somewhere/else"
+  assert os.listdir(local_storage.directory) == [original["public_id"]]
@@ -0,0 +1,56 @@
+import asyncio
+from datetime import datetime
+import pytz
+import models
+from duplicates import find_duplicate
+from jobs import create_job, find_job
+
+def now():
+  return datetime.now(pytz.timezone("Asia/Manila"))
+
+def assessments(Session, count):
+  with Session() as db:
+    student = models.User(name="student", role="student")
+    rows = [models.PronunciationAssessment(assessment_title=f"assessment {i}") for i in range(count)]
+    db.add_all([student, *rows])
+    db.commit()
+    return student.user_id, [row.assessment_id for row in rows]
+
+def test_idempotency_key_matches_the_same_assessment_only(database):
+  student_id, (first, second) = assessments(database, 2)
+  with database() as db:
+    db.add(models.AssessmentHistory(student_id=student_id, assessment_id=first, score=80, date_taken=now(), audio_hash="a", idempotency_key="key"))
+    db.commit()
+    assert find_duplicate(db, models.AssessmentHistory, student_id, {"assessment_id": first}, "b", "key").score == 80
+    assert find_duplicate(db, models.AssessmentHistory, student_id, {"assessment_id": second}, "b", "key") is None
+    assert find_duplicate(db, models.AssessmentHistory, student_id + 1, {"assessment_id": first}, "b", "key") is None
+
+def test_idempotency_key_matches_the_job_for_the_same_params_only(database):
+  student_id, (first, second) = assessments(database, 2)
+  with database() as db:
+    params = {"assessment_id": first, "stage_id": 1}
+    job_id = create_job(db, "phoneme", student_id, params, b"", None, "a", "key")
+    assert find_job(db, "phoneme", student_id, params, "b", "key") == job_id
+    assert find_job(db, "phoneme", student_id, params, "a") == job_id
+    assert find_job(db, "phoneme", student_id, {"assessment_id": second, "stage_id": 1}, "b", "key") is None
+    assert find_job(db, "practice", student_id, {"practice_id": first}, "b", "key") is None
+
+def flights(monkeypatch, window):
+  import duplicates
+  monkeypatch.setattr(duplicates, "DUPLICATE_WINDOW_SECONDS", window)
+  runs = []
+
+  async def make():
+    runs.append(1)
+    await asyncio.sleep(0.01)
+    return len(runs)
+
+  async def both():
+    return await asyncio.gather(duplicates.single_flight("key", make), duplicates.single_flight("key", make))
+  return asyncio.run(both()), len(runs)
+
+def test_repeats_in_flight_are_merged(monkeypatch):
+  assert flights(monkeypatch, 600) == ([1, 1], 1)
+
+def test_no_merging_without_a_duplicate_window(monkeypatch):
+  assert flights(monkeypatch, 0) == ([2, 2], 2)
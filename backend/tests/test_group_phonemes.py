@@ -0,0 +1,115 @@
+import json
+import os
+import numpy as np
+from phoneme import groupPhonemes
+
+RECORDED = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "group_phonemes.jsonl")
+
+#the loop groupPhonemes replaced, as it was in phoneme.py
+def group_phonemes_loop(audio_phonemes, word_offsets, char_offsets):
+  grouped_phonemes = []
+  current_word = []
+  word_index = 0
+  char_index = 0
+  next_word_index = 1
+  word_reset_offset = int(word_offsets[word_index]['start_offset'])
+  char_reset_offset = int(char_offsets[char_index]['start_offset'])
+  while char_index < len(char_offsets) and word_index < len(word_offsets):
+      if next_word_index >= len(word_offsets) and char_index < len(char_offsets):
+        current_word.append(char_offsets[char_index]['char'].replace("ː",""))
+        char_index += 1
+      elif word_index < len(word_offsets) and char_index < len(char_offsets):
+        word_start = int(word_offsets[word_index]['start_offset']) - word_reset_offset
+        word_end = int(word_offsets[word_index]['end_offset']) - word_reset_offset
+        next_word_start = int(word_offsets[next_word_index]['start_offset']) - word_reset_offset
+        char_start = int(char_offsets[char_index]['start_offset']) - char_reset_offset
+        char_end = int(char_offsets[char_index]['end_offset']) - char_reset_offset
+        if char_start >= word_start and char_start < next_word_start:
+            current_word.append(char_offsets[char_index]['char'].replace("ː",""))
+            char_index += 1
+        elif char_index < len(char_offsets) and char_start >= word_end:
+            if current_word:
+                grouped_phonemes.append(''.join(current_word))
+                current_word = []
+                word_index += 1
+                next_word_index += 1
+            else:
+              break
+  if current_word:
+      grouped_phonemes.append(''.join(current_word))
+
+  return grouped_phonemes
+
+#the loop stops at the first word, other than the last, that no char starts in (from its start up to
+#the next word's start, both relative to the first word and the first char) and drops every char after
+#it. Returns that word's index, or None when every word before the last has a char.
+def first_empty_word(word_offsets, char_offsets):
+  word_starts = [int(offset["start_offset"]) - int(word_offsets[0]["start_offset"]) for offset in word_offsets]
+  char_starts = [int(offset["start_offset"]) - int(char_offsets[0]["start_offset"]) for offset in char_offsets]
+  for index in range(len(word_starts) - 1):
+    if not any(word_starts[index] <= start < word_starts[index + 1] for start in char_starts):
+      return index
+  return None
+
+#groupPhonemes against the loop: equal, except that where the loop stopped at an empty word it returns
+#only the words before it
+def assert_agrees(word_offsets, char_offsets, old):
+  new = groupPhonemes(None, word_offsets, char_offsets)
+  empty = first_empty_word(word_offsets, char_offsets)
+  assert old == (new if empty is None else new[:empty])
+  return old != new
+
+PHONEMES = ["p", "b", "t", "d", "k", "s", "z", "ʃ", "tʃ", "m", "n", "ŋ", "l", "ɹ", "w", "i", "iː", "ɪ", "ɛ", "æ", "ɑː", "ʊ", "uː", "ʌ", "ə", "aɪ"]
+
+#words with gaps between them and chars inside, with skip_words some words get none
+def generated_case(rng, words, skip_words):
+  word_offsets, char_offsets = [], []
+  position = int(rng.integers(0, 50))
+  for i in range(words):
+    start, length = position, int(rng.integers(3, 40))
+    word_offsets.append({"word": f"w{i}", "start_offset": start, "end_offset": start + length})
+    if not (skip_words and i and rng.random() < 0.1):
+      frames = np.sort(rng.choice(length, size=min(length, int(rng.integers(1, 8))), replace=False))
+      if i == 0:
+        frames[0] = 0
+      char_offsets += [{"char": str(rng.choice(PHONEMES)), "start_offset": start + int(frame), "end_offset": start + int(frame) + 1}
+                       for frame in frames]
+    position = start + length + int(rng.integers(0, 10))
+  #both lists are compared relative to their first offset, so a different onset must not matter
+  shift = int(rng.integers(0, 20))
+  for offset in char_offsets:
+    offset["start_offset"] += shift
+    offset["end_offset"] += shift
+  return word_offsets, char_offsets
+
+#outputs of the loop, written by benchmarks/bench_group_phonemes.py --record
+def test_recorded_loop_outputs():
+  with open(RECORDED, encoding="utf-8") as f:
+    records = [json.loads(line) for line in f]
+  assert records
+  for record in records:
+    assert_agrees(record["word_offsets"], record["char_offsets"], record["grouped"])
+
+def test_generated_cases_match_the_loop():
+  rng = np.random.default_rng(1)
+  dropped = 0
+  for i in range(1000):
+    word_offsets, char_offsets = generated_case(rng, int(rng.integers(1, 40)), skip_words=i % 2 == 1)
+    dropped += assert_agrees(word_offsets, char_offsets, group_phonemes_loop(None, word_offsets, char_offsets))
+  assert dropped
+
+def offsets(*spans, key="word"):
+  return [{key: f"{key}{i}", "start_offset": start, "end_offset": end} for i, (start, end) in enumerate(spans)]
+
+def test_word_without_chars_is_skipped():
+  word_offsets = offsets((0, 5), (5, 10), (10, 15))
+  char_offsets = offsets((0, 1), (1, 2), (11, 12), key="char")
+  assert groupPhonemes(None, word_offsets, char_offsets) == ["char0char1", "char2"]
+  assert group_phonemes_loop(None, word_offsets, char_offsets) == ["char0char1"]
+
+#forced word offsets come from the same frames as the chars, the first char is not at the first word's start
+def test_same_time_base_compares_absolute_frames():
+  word_offsets = offsets((0, 10), (10, 20))
+  char_offsets = offsets((4, 5), (8, 9), (12, 13), key="char")
+  assert groupPhonemes(None, word_offsets, char_offsets, sameTimeBase=True) == ["char0char1", "char2"]
+  assert groupPhonemes(None, word_offsets, char_offsets) == ["char0char1char2"]
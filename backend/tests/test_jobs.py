@@ -0,0 +1,68 @@
+import asyncio
+import threading
+from datetime import timedelta
+from fastapi import HTTPException
+import models
+from jobs import claim_job, create_job, finish_job, now
+
+def queue(Session, count):
+  with Session() as db:
+    return [create_job(db, "bench", None, {}, b"", None) for _ in range(count)]
+
+#a session holding the oldest row (as a claim in progress does) makes the other one skip it
+def test_claim_skips_a_job_being_claimed(database):
+  first, second = queue(database, 2)
+  with database() as holding, database() as db:
+    locked = holding.query(models.ScoringJob).order_by(models.ScoringJob.created_at).with_for_update().first()
+    assert locked.job_id == first
+    assert claim_job(db, "b").job_id == second
+    assert claim_job(db, "b") is None
+    holding.rollback()
+    assert claim_job(db, "b").job_id == first
+
+def test_concurrent_workers_never_claim_the_same_job(database):
+  job_ids = queue(database, 200)
+  claimed = {}
+  start = threading.Barrier(8)
+
+  def drain(worker):
+    start.wait()
+    with database() as db:
+      while (job := claim_job(db, worker)) is not None:
+        claimed.setdefault(job.job_id, []).append(worker)
+
+  threads = [threading.Thread(target=drain, args=(f"worker-{i}",)) for i in range(8)]
+  for thread in threads:
+    thread.start()
+  for thread in threads:
+    thread.join()
+  assert sorted(claimed) == sorted(job_ids)
+  assert all(len(workers) == 1 for workers in claimed.values())
+
+def test_expired_lease_is_claimed_again(database):
+  job_id, = queue(database, 1)
+  with database() as db:
+    assert claim_job(db, "a").job_id == job_id
+    assert claim_job(db, "b") is None
+    db.query(models.ScoringJob).update({"lease_expires_at": now() - timedelta(seconds=1)})
+    db.commit()
+    job = claim_job(db, "b")
+    assert (job.job_id, job.worker, job.attempts) == (job_id, "b", 2)
+    #the worker that lost the lease can not finish the job
+    assert finish_job(db, job_id, "a", status="done") == 0
+    assert finish_job(db, job_id, "b", status="done") == 1
+
+def test_busy_scoring_queue_does_not_use_up_attempts(database, monkeypatch):
+  import jobs
+  monkeypatch.setattr(jobs, "JOB_POLL_SECONDS", 0)
+  job_id, = queue(database, 1)
+
+  async def busy(db, job):
+    raise HTTPException(status_code=503, detail="busy")
+
+  for _ in range(jobs.JOB_MAX_ATTEMPTS + 1):
+    with database() as db:
+      asyncio.run(jobs.run_claimed(db, claim_job(db, "a"), busy, "a"))
+  with database() as db:
+    job = db.get(models.ScoringJob, job_id)
+    assert (job.status, job.attempts) == ("queued", 0)
@@ -0,0 +1,18 @@
+import phoneme
+from lexicon import Lexicon
+
+def fake_lexicon(monkeypatch):
+  lexicon = Lexicon(lambda word: (tuple(word.lower()), tuple(word.lower())), persist=False)
+  monkeypatch.setattr(phoneme, "lexicon", lexicon)
+  return lexicon
+
+#every token is looked up once, so the hit and miss counts describe the text
+def test_word_index_looks_each_token_up_once(monkeypatch):
+  lexicon = fake_lexicon(monkeypatch)
+  text = "The cat,  saw\tthe dog."
+  index = phoneme.wordIndex(text)
+  assert [entry["word"] for entry in index] == text.split(" ")
+  assert index[1]["clean"] == "cat" and index[2]["phonemes"] == [] and index[3]["raw_phonemes"] == list("sawthe")
+  assert lexicon.stats()["tokens"] == len(text.split()) and lexicon.stats()["converted"] == 5
+  expected = phoneme.textToPhoneme(text)
+  assert phoneme.indexPhonemes(index) == expected
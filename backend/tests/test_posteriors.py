@@ -0,0 +1,24 @@
+import numpy as np
+from posteriors import PosteriorStore, audio_digest, cached_posteriors
+
+def logits(arrays):
+  return [np.tile(np.arange(4, dtype=np.float32), (len(a) // 320, 1)) * a.mean() for a in arrays]
+
+def test_cache_is_keyed_on_the_recording_and_its_preprocessing(tmp_path):
+  store = PosteriorStore(str(tmp_path), 1 << 20)
+  y = np.random.default_rng(0).standard_normal(16000).astype(np.float32)
+  digest = audio_digest(y)
+  runs = []
+  def run(arrays):
+    runs.append(len(arrays))
+    return logits(arrays)
+  keys = [store.key(digest, "1:raw:novad", "model:torch"), store.key(digest, "1:medfilt:novad", "model:torch")]
+  first = cached_posteriors(store, keys, [y, y * 0.5], run)
+  #the model input is not part of the key, the same recording preprocessed the same way is a hit
+  again = cached_posteriors(store, keys, [y[:3200], y[:3200]], run)
+  assert runs == [2] and all(np.array_equal(a, b) for a, b in zip(first, again))
+  cached_posteriors(store, [store.key(digest, "1:raw:vad:6", "model:torch")], [y], run)
+  cached_posteriors(store, [store.key(digest, "1:raw:novad", "model:onnx")], [y], run)
+  cached_posteriors(store, [store.key(audio_digest(y * 0.9), "1:raw:novad", "model:torch")], [y], run)
+  assert runs == [2, 1, 1, 1]
+  assert store.stats()["hits"] == 2
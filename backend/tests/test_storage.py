@@ -0,0 +1,24 @@
+import io
+import numpy as np
+import pytest
+import soundfile
+from storage import reencode
+
+def wav(y, subtype):
+  encoded = io.BytesIO()
+  soundfile.write(encoded, y, 16000, format="WAV", subtype=subtype)
+  return encoded.getvalue()
+
+@pytest.mark.parametrize("subtype", ["PCM_U8", "PCM_16", "PCM_24"])
+def test_flac_keeps_every_sample(subtype):
+  t = np.arange(16000) / 16000
+  y = 0.5 * np.sin(2 * np.pi * 220 * t) + np.random.default_rng(0).normal(0, 0.01, t.shape)
+  data = wav(y, subtype)
+  flac = reencode(data, "flac")
+  assert soundfile.info(io.BytesIO(flac)).format == "FLAC" and len(flac) < len(data)
+  assert np.array_equal(soundfile.read(io.BytesIO(flac), dtype="int32")[0], soundfile.read(io.BytesIO(data), dtype="int32")[0])
+
+@pytest.mark.parametrize("subtype", ["FLOAT", "PCM_32"])
+def test_wav_flac_can_not_hold_is_kept(subtype):
+  data = wav(np.random.default_rng(0).uniform(-0.9, 0.9, 1600), subtype)
+  assert reencode(data, "flac") == data
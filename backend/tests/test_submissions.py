@@ -0,0 +1,25 @@
+import asyncio
+import io
+import threading
+from datetime import datetime
+import pytest
+from fastapi import HTTPException
+import executors
+from routers import submissionRoutes
+
+def test_spooled_submission_has_no_audio_url_yet():
+  submission = submissionRoutes.PhonemeSubmission(student_id=1, history_id=1, score=50, assessment_id=1, assessment_title="a",
+    text_content="a", student_audio_url=None, assessment_audio_url="a", phoneme_content=[], phoneme_output=[], date_taken=datetime(2024, 1, 1))
+  assert submission.student_audio_url is None
+
+#a submission turned away while the scoring queue is full does not upload its recording
+def test_busy_submission_is_not_uploaded(monkeypatch):
+  uploads = []
+  monkeypatch.setattr(executors, "_scoring_slots", threading.BoundedSemaphore(1))
+  executors._scoring_slots.acquire()
+  monkeypatch.setattr(submissionRoutes, "get_practice_word", lambda db, practice_id: None)
+  monkeypatch.setattr(submissionRoutes, "start_upload", lambda *args: uploads.append(args))
+  with pytest.raises(HTTPException) as error:
+    asyncio.run(submissionRoutes.process_practice_submission(None, 1, 1, io.BytesIO(b""), None))
+  assert error.value.status_code == 503
+  assert uploads == []
@@ -0,0 +1,67 @@
+import numpy as np
+from config import VAD_MARGIN_DB, VAD_MIN_SNR_DB, VAD_PAD_MS, VAD_MAX_PAUSE_MS
+
+#Energy based voice activity detection ahead of the model. Silence at the edges of a recording is cut
+#and long pauses are shortened. The frames are 20 ms, the same rate as the wav2vec2 logits (320 samples
+#at 16 kHz), so a Trim maps char and word offsets from the trimmed clip straight back to the recording.
+
+FRAME_MS = 20
+
+class Trim:
+  def __init__(self, keep, frame_length):
+    #original index of every kept frame, in order
+    self.frames = np.flatnonzero(keep)
+    self.total_frames = len(keep)
+    self.frame_length = frame_length
+
+  def apply(self, y):
+    breaks = np.flatnonzero(np.diff(self.frames) != 1)
+    starts = np.concatenate([self.frames[:1], self.frames[breaks + 1]])
+    ends = np.concatenate([self.frames[breaks], self.frames[-1:]]) + 1
+    return np.concatenate([y[start * self.frame_length:end * self.frame_length] for start, end in zip(starts, ends)])
+
+  def start_frame(self, frame):
+    return int(self.frames[min(max(int(frame), 0), len(self.frames) - 1)])
+
+  def end_frame(self, frame):
+    frame = min(int(frame), len(self.frames))
+    return int(self.frames[frame - 1]) + 1 if frame > 0 else int(self.frames[0])
+
+  #offsets in the batch_decode format ({"start_offset", "end_offset", ...} in logit frames)
+  def map_offsets(self, offsets):
+    return [dict(offset, start_offset=self.start_frame(offset["start_offset"]), end_offset=self.end_frame(offset["end_offset"]))
+            for offset in offsets]
+
+#returns a Trim, or None when nothing would be cut or speech can not be told apart from the noise
+def trim_silence(y, sr):
+  frame_length = int(sr * FRAME_MS / 1000)
+  count = -(-len(y) // frame_length)
+  if count == 0:
+    return None
+  padded = np.zeros(count * frame_length, dtype=np.float32)
+  padded[:len(y)] = y
+  energy = 10 * np.log10(np.mean(padded.reshape(count, frame_length) ** 2, axis=1) + 1e-10)
+  floor = np.percentile(energy, 10)
+  if energy.max() - floor < VAD_MIN_SNR_DB:
+    return None
+  speech = energy > floor + VAD_MARGIN_DB
+  if not speech.any():
+    return None
+  #keep VAD_PAD_MS around every speech frame so soft onsets and word endings are not clipped
+  pad = int(VAD_PAD_MS / FRAME_MS)
+  keep = np.convolve(speech, np.ones(2 * pad + 1), mode="same") > 0
+  #pauses between the first and last speech frame are kept up to VAD_MAX_PAUSE_MS, split evenly
+  #between the end of the previous word and the start of the next
+  max_pause = int(VAD_MAX_PAUSE_MS / FRAME_MS)
+  kept = np.flatnonzero(keep)
+  inner = keep[kept[0]:kept[-1] + 1]
+  gaps = np.flatnonzero(np.diff(np.concatenate([[1], inner.astype(np.int8), [1]])))
+  for start, end in zip(gaps[::2], gaps[1::2]):
+    if end - start <= max_pause:
+      inner[start:end] = True
+    else:
+      inner[start:start + max_pause // 2] = True
+      inner[end - (max_pause - max_pause // 2):end] = True
+  if keep.all():
+    return None
+  return Trim(keep, frame_length)